@@ -0,0 +1,142 @@
+import threading
+
+import psycopg2.extras
+from psycopg2 import pool as psycopg2_pool
+from django.db.backends.postgresql import base
+
+# Настройки пула по умолчанию, переопределяются в OPTIONS['pool']
+POOL_DEFAULTS = {
+    # Сколько простаивающих соединений пул держит открытыми
+    'min_size': 2,
+    # Больше соединений к базе процесс не откроет
+    'max_size': 10,
+    # Сколько секунд ждать свободное соединение
+    'timeout': 30,
+    # Проверять соединение SELECT 1 перед выдачей
+    'check': True,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    # ThreadedConnectionPool при исчерпании сразу падает,
+    # ожидание свободного соединения - через семафор
+    def __init__(self, conn_params: dict, min_size: int, max_size: int,
+                 timeout: float, check: bool = True):
+        self.timeout = timeout
+        self.check = check
+        self.max_size = max_size
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.pool = psycopg2_pool.ThreadedConnectionPool(
+            min_size, max_size, **conn_params
+        )
+
+    def getconn(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise base.Database.OperationalError(
+                f'No free connection in the pool after {self.timeout}s'
+            )
+
+        try:
+            return self.get_usable()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def get_usable(self):
+        # Простаивающих соединений не больше max_size, поэтому последняя
+        # попытка уже открывает новое соединение
+        for _ in range(self.max_size + 1):
+            connection = self.pool.getconn()
+            if self.is_usable(connection):
+                return connection
+
+            # Оборванное сервером (рестарт, таймаут простоя, сеть)
+            # или закрытое клиентом соединение меняем на новое
+            self.pool.putconn(connection, close=True)
+
+        raise base.Database.OperationalError(
+            'No usable connection in the pool'
+        )
+
+    def is_usable(self, connection) -> bool:
+        if connection.closed:
+            return False
+        if not self.check:
+            return True
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            # Без autocommit SELECT открыл транзакцию
+            connection.rollback()
+        except base.Database.Error:
+            return False
+
+        return True
+
+    def putconn(self, connection, close: bool = False) -> None:
+        # Незавершенную транзакцию пул откатит сам, потерянное
+        # соединение закроет
+        try:
+            self.pool.putconn(connection, close=close)
+        finally:
+            self.slots.release()
+
+
+def get_pool(conn_params: dict, options: dict | None) -> ConnectionPool:
+    key = repr(sorted(conn_params.items()))
+
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(
+                conn_params,
+                **{**POOL_DEFAULTS, **(options or {})}
+            )
+
+    return _pools[key]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # Соединения берутся из пула процесса и возвращаются в него при close(),
+    # поэтому повторно используются и при CONN_MAX_AGE = 0, и под ASGI
+    pool = None
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(
+            conn_params,
+            self.settings_dict['OPTIONS'].get('pool')
+        )
+        connection = self.pool.getconn()
+
+        # Как в postgresql.DatabaseWrapper.get_new_connection
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda x: x
+        )
+
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+
+        # Внутри atomic Django оставляет ссылку на соединение,
+        # отдавать его в пул другому потоку нельзя
+        with self.wrap_database_errors:
+            self.pool.putconn(self.connection, close=self.in_atomic_block)
@@ -1,3 +1,4 @@
+from importlib.util import find_spec
 from pathlib import Path
 import os
 
@@ -31,6 +32,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Сжимает тело после всех остальных middleware
+    'store.middleware.CompressionMiddleware',
+    # Выбор реплики на запрос, закрепление за основной базой после записи
+    'store.middleware.replica_pinning_middleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -62,17 +67,151 @@ WSGI_APPLICATION = 'book.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# Пул соединений внутри процесса (DB_POOL=1): соединение возвращается в пул
+# после каждого запроса. Без пула соединение потока живет CONN_MAX_AGE
+# секунд, но под ASGI каждый запрос выполняет view в новом потоке:
+# постоянное соединение больше не используется и остается открытым.
+# Поэтому CONN_MAX_AGE по умолчанию 0, для WSGI его можно поднять
+DB_POOL = os.getenv('DB_POOL', '0') in ('1', 'true')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': (
+            'book.db.postgresql_pool' if DB_POOL
+            else 'django.db.backends.postgresql_psycopg2'
+        ),
         'NAME': 'book',
         'USER': os.getenv('USER_DB'),
         'PASSWORD': os.getenv('PASSWORD_DB'),
         'HOST': 'localhost',
-        'PORT': ''
+        'PORT': '',
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0)),
+        # Перед повторным использованием соединение проверяется SELECT 1
+        'CONN_HEALTH_CHECKS': (
+            os.getenv('DB_CONN_HEALTH_CHECKS', '1') in ('1', 'true')
+        ),
+        'OPTIONS': {},
+    }
+}
+
+if DB_POOL:
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+        # SELECT 1 при выдаче соединения из пула
+        'check': DATABASES['default']['CONN_HEALTH_CHECKS'],
+    }
+
+# Реплики для чтения каталога: DB_REPLICA_HOSTS=host1,host2. Реплика - копия
+# основной базы, в тестах она зеркалит default. С DB_REPLICA_TEST_SEPARATE=1
+# у реплики своя пустая тестовая база (сервер должен принимать запись),
+# тогда идут и тесты отставания реплики:
+# DB_REPLICA_HOSTS=localhost DB_REPLICA_TEST_SEPARATE=1 \
+#     python manage.py test store.tests.test_routers
+REPLICA_DATABASES = []
+REPLICA_TEST_SEPARATE = (
+    os.getenv('DB_REPLICA_TEST_SEPARATE', '0') in ('1', 'true')
+)
+
+for number, host in enumerate(
+        filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': (
+            {'NAME': f'test_{DATABASES["default"]["NAME"]}_{alias}'}
+            if REPLICA_TEST_SEPARATE else {'MIRROR': 'default'}
+        ),
+    }
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['store.routers.ReplicaRouter']
+# Модели, которые безопасные запросы читают с реплики
+REPLICA_MODELS = ['store.book', 'store.userbookrelation']
+# Сколько секунд после записи пользователь читает с основной базы
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+# Профилирование запросов: Server-Timing, гистограммы по view в
+# store.Metric, /metrics и dump_metrics. cProfile снимается для доли
+# запросов PROFILING_SAMPLE_RATE и сохраняется в PROFILING_DIR, если запрос
+# дольше PROFILING_SLOW_SECONDS
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', '0') in ('1', 'true')
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_SLOW_SECONDS = float(os.getenv('PROFILING_SLOW_SECONDS', 1))
+PROFILING_DIR = os.getenv('PROFILING_DIR', BASE_DIR / 'profiles')
+
+if PROFILING_ENABLED:
+    MIDDLEWARE.insert(0, 'store.middleware.ProfilingMiddleware')
+
+# Гистограммы профилирования и статистика кеша ответов копятся в процессе
+# и раз в METRICS_FLUSH_SECONDS сливаются в store.Metric, общую для всех
+# процессов. Чтение (/metrics, dump_metrics, book_cache_stats) сливает
+# накопленное своим процессом сразу
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', 10))
+
+# Cache
+# По умолчанию - память процесса, Redis подключается через REDIS_URL
+
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'book',
+        }
     }
+
+# Время жизни закешированных ответов /api/book/ в секундах
+BOOK_CACHE_TIMEOUT = int(os.getenv('BOOK_CACHE_TIMEOUT', 60))
+
+# Сжатие ответов: br (если установлен brotli) или gzip по Accept-Encoding.
+# Ответы меньше COMPRESSION_MIN_SIZE байт отдаются как есть
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+# Уровни сжатия на лету. Ответы для кеша сжимаются один раз на промах,
+# поэтому плотнее
+COMPRESSION_LEVELS = {'gzip': 6, 'br': 4}
+COMPRESSION_CACHE_LEVELS = {'gzip': 9, 'br': 9}
+
+# Полный пересчет рейтинга книги (set_rating): sync - сразу в запросе,
+# deferred - через очередь, которую разбирает process_rating_queue.
+# Изменения оценок сразу учитывает триггер на store_userbookrelation
+RATING_RECOMPUTE_MODE = os.getenv('RATING_RECOMPUTE_MODE', 'sync')
+# Пауза между проходами обработчика очереди в секундах
+RATING_FLUSH_LATENCY = float(os.getenv('RATING_FLUSH_LATENCY', 1))
+
+# orjson и msgpack необязательны: без orjson JSON рендерит стандартный
+# JSONRenderer, без msgpack формат application/msgpack недоступен
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'store.renderers.ORJSONRenderer' if find_spec('orjson')
+        else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+if find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append(
+        'store.renderers.MessagePackRenderer'
+    )
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append(
+        'store.parsers.MessagePackParser'
+    )
+
 AUTHENTICATION_BACKENDS = (
     'social_core.backends.github.GithubOAuth2',
     'django.contrib.auth.backends.ModelBackend',
@@ -3,7 +3,10 @@ from django.urls import path, include
 
 from rest_framework.routers import DefaultRouter
 
-from store.views import BookViewSet, auth_github, UserBookRelationView
+from store import async_views
+from store.views import (
+    BookViewSet, auth_github, metrics, UserBookRelationView
+)
 
 router = DefaultRouter()
 router.register('book', BookViewSet, 'books')
@@ -12,6 +15,14 @@ router.register('book-relations', UserBookRelationView, 'relations')
 urlpatterns = [
     path('auth/github/', auth_github),
     path('admin/', admin.site.urls),
+    path('metrics', metrics, name='metrics'),
     path('api/', include(router.urls)),
+    # Асинхронное чтение каталога для ASGI
+    path('api/async/book/', async_views.book_list, name='async-books-list'),
+    path(
+        'api/async/book/<int:pk>/',
+        async_views.book_detail,
+        name='async-books-detail'
+    ),
     path('', include('social_django.urls', namespace='social')),
 ]
@@ -1,13 +1,133 @@
 from django.contrib import admin
+from django.db import connections
+from django.db.models import Q
 
+from .cache import invalidate_books
+from .filters import BookSearchFilter
 from .models import Book, UserBookRelation
+from .pagination import EstimatedCountPaginator
+from .utils import (
+    iterate_book_batches, rebuild_book_counters, recompute_book_ratings,
+    refresh_book_stats
+)
+
+# Книги в пакетных действиях обновляются пачками такого размера
+ACTION_BATCH_SIZE = 1000
+
+
+class RatingListFilter(admin.SimpleListFilter):
+    # Диапазоны по индексу (rating, id), варианты без запроса к базе
+    title = 'рейтинг'
+    parameter_name = 'rating'
+    ranges = {
+        'none': Q(rating__isnull=True),
+        'low': Q(rating__lt=3),
+        'medium': Q(rating__gte=3, rating__lt=4),
+        'high': Q(rating__gte=4),
+    }
+
+    def lookups(self, request, model_admin):
+        return (
+            ('none', 'Без оценок'),
+            ('low', 'Ниже 3'),
+            ('medium', 'От 3 до 4'),
+            ('high', 'От 4'),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() in self.ranges:
+            return queryset.filter(self.ranges[self.value()])
+
+        return queryset
+
+
+class DiscountListFilter(admin.SimpleListFilter):
+    # По индексу (discount, id)
+    title = 'скидка'
+    parameter_name = 'has_discount'
+
+    def lookups(self, request, model_admin):
+        return (('1', 'Есть'), ('0', 'Нет'))
+
+    def queryset(self, request, queryset):
+        if self.value() == '1':
+            return queryset.filter(discount__gt=0)
+        if self.value() == '0':
+            return queryset.filter(Q(discount__isnull=True) | Q(discount=0))
+
+        return queryset
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    # Без COUNT(*) по всей таблице на каждой странице списка
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    # По первичному ключу, в том числе для автодополнения
+    ordering = ('-id',)
 
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
-    pass
+class BookAdmin(LargeTableAdmin):
+    list_display = (
+        'id', 'name', 'author', 'owner', 'price', 'discount', 'end_price',
+        'rating', 'count_likes', 'count_readers', 'updated_at'
+    )
+    list_select_related = ('owner',)
+    # Фильтры только по индексированным колонкам и без списка значений
+    # из базы: фильтр по владельцу вывел бы всех пользователей
+    list_filter = (RatingListFilter, DiscountListFilter, 'updated_at')
+    search_fields = ('name', 'author')
+    autocomplete_fields = ('owner',)
+    readonly_fields = (
+        'end_price', 'rating', 'rating_sum', 'rating_count', 'count_likes',
+        'count_bookmarks', 'count_readers', 'updated_at'
+    )
+    actions = ('recompute_ratings', 'rebuild_counters')
+
+    def get_queryset(self, request):
+        # search_vector не показывается и заполняется триггером
+        return super().get_queryset(request).defer('search_vector')
+
+    def get_search_results(self, request, queryset, search_term):
+        # На Postgres ищем по search_vector (GIN индекс), как API
+        if (connections[queryset.db].vendor != 'postgresql' or
+                not search_term.strip()):
+            return super().get_search_results(request, queryset, search_term)
+
+        query = BookSearchFilter().get_search_query([search_term])
+        if query is None:
+            return queryset.none(), False
+
+        return queryset.filter(search_vector=query), False
+
+    @admin.action(description='Пересчитать рейтинг выбранных книг')
+    def recompute_ratings(self, request, queryset):
+        updated = recompute_book_ratings(queryset, ACTION_BATCH_SIZE)
+        self.message_user(request, f'Пересчитан рейтинг книг: {updated}')
+
+    @admin.action(description='Пересчитать счетчики выбранных книг')
+    def rebuild_counters(self, request, queryset):
+        updated = rebuild_book_counters(queryset, ACTION_BATCH_SIZE)
+        self.message_user(request, f'Пересчитаны счетчики книг: {updated}')
 
 
 @admin.register(UserBookRelation)
-class UserBookRelationAdmin(admin.ModelAdmin):
-    pass
+class UserBookRelationAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'book', 'rate', 'like', 'is_bookmark')
+    # __str__ и колонки user, book - без запроса на строку
+    list_select_related = ('user', 'book')
+    list_filter = ('rate', 'like', 'is_bookmark')
+    autocomplete_fields = ('user', 'book')
+    actions = ('refresh_books',)
+
+    @admin.action(description='Пересчитать книги выбранных связей')
+    def refresh_books(self, request, queryset):
+        books = Book.objects.filter(pk__in=queryset.values('book_id'))
+        updated = 0
+
+        for batch in iterate_book_batches(books, ACTION_BATCH_SIZE):
+            updated += refresh_book_stats(batch)
+            invalidate_books(batch)
+
+        self.message_user(request, f'Пересчитано книг: {updated}')
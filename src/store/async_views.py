@@ -0,0 +1,116 @@
+import json
+
+import django
+from django.http import (
+    HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+)
+from django.utils.http import urlencode
+
+from .mixins.book import BookMixin, get_reader_preview_queryset
+from .models import Book
+from .renderers import FastJSONRenderer
+from .serializers import BookSerializer
+
+# Асинхронные итераторы в StreamingHttpResponse поддерживаются с Django 4.2,
+# в более ранних версиях ответ собирается целиком
+ASYNC_STREAMING = django.VERSION >= (4, 2)
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 500
+CHUNK_SIZE = 50
+
+renderer = FastJSONRenderer()
+
+
+def get_queryset():
+    # Читателей грузим сами, пачками по CHUNK_SIZE книг
+    return BookMixin.get_books_queryset()
+
+
+async def attach_reader_preview(books: list) -> None:
+    previews = {book.pk: [] for book in books}
+
+    async for relation in get_reader_preview_queryset(previews):
+        previews[relation.book_id].append(relation)
+
+    for book in books:
+        book.reader_preview = previews[book.pk]
+
+
+async def iterate_books(queryset, chunk_size: int = CHUNK_SIZE):
+    chunk = []
+
+    async for book in queryset.aiterator(chunk_size=chunk_size):
+        chunk.append(book)
+
+        if len(chunk) == chunk_size:
+            await attach_reader_preview(chunk)
+            for item in chunk:
+                yield item
+            chunk = []
+
+    if chunk:
+        await attach_reader_preview(chunk)
+        for item in chunk:
+            yield item
+
+
+async def render_books(request, queryset, limit: int):
+    last_pk, count = None, 0
+
+    yield b'{"results":['
+    async for book in iterate_books(queryset[:limit]):
+        yield (b',' if count else b'') + renderer.render(
+            BookSerializer(book).data
+        )
+        last_pk, count = book.pk, count + 1
+
+    next_url = None
+    if count == limit:
+        next_url = request.build_absolute_uri(
+            f'{request.path}?{urlencode({"after": last_pk, "limit": limit})}'
+        )
+    yield b'],"next":' + json.dumps(next_url).encode() + b'}'
+
+
+async def make_response(chunks):
+    if ASYNC_STREAMING:
+        return StreamingHttpResponse(chunks, content_type='application/json')
+
+    content = b''.join([chunk async for chunk in chunks])
+    return HttpResponse(content, content_type='application/json')
+
+
+async def book_list(request):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    try:
+        after = int(request.GET.get('after', 0))
+        limit = min(int(request.GET.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'detail': 'Invalid after or limit.'}, status=400)
+
+    # Keyset по id: любая страница стоит столько же, сколько первая
+    queryset = get_queryset().filter(pk__gt=after).order_by('pk')
+
+    return await make_response(
+        render_books(request, queryset, max(limit, 1))
+    )
+
+
+async def book_detail(request, pk):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+
+    try:
+        book = await get_queryset().aget(pk=pk)
+    except Book.DoesNotExist:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+
+    await attach_reader_preview([book])
+
+    return HttpResponse(
+        renderer.render(BookSerializer(book).data),
+        content_type='application/json'
+    )
@@ -0,0 +1,146 @@
+import datetime
+import hashlib
+import time
+from typing import Iterable
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache
+from django.utils.http import urlencode
+
+from .metrics import metrics
+
+LIST_VERSION_KEY = 'book:list:version'
+CATALOGUE_VERSION_KEY = 'book:catalogue:version'
+BOOK_VERSION_KEY = 'book:{pk}:version'
+RESPONSE_KEY = 'book:response:{name}:{version}:{params}'
+STATS_PREFIX = 'book:cache:'
+HITS_KEY = STATS_PREFIX + 'hits'
+MISSES_KEY = STATS_PREFIX + 'misses'
+# Кеши в памяти процесса: у каждого воркера свои версии
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_cache_shared() -> bool:
+    return (
+        settings.CACHES[DEFAULT_CACHE_ALIAS]['BACKEND']
+        not in LOCAL_CACHE_BACKENDS
+    )
+
+
+def _new_version() -> int:
+    return time.time_ns()
+
+
+def _get_version(key: str) -> int:
+    version = cache.get(key)
+
+    if version is None:
+        version = _new_version()
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+
+    return version
+
+
+def get_version_time(version: int) -> datetime.datetime:
+    # Версия - время изменения в наносекундах
+    return datetime.datetime.fromtimestamp(
+        version / 1e9, tz=datetime.timezone.utc
+    )
+
+
+def get_list_version() -> int:
+    return _get_version(LIST_VERSION_KEY)
+
+
+def get_catalogue_version() -> int:
+    return _get_version(CATALOGUE_VERSION_KEY)
+
+
+def get_book_version(pk) -> int:
+    return _get_version(BOOK_VERSION_KEY.format(pk=pk))
+
+
+def get_book_versions(pks: Iterable) -> dict:
+    keys = {BOOK_VERSION_KEY.format(pk=pk): pk for pk in pks}
+    values = cache.get_many(keys)
+
+    for key in keys.keys() - values.keys():
+        # Книгу еще не меняли или версию вытеснили: 0 старше любой записи
+        cache.add(key, 0, None)
+        values[key] = cache.get(key, 0)
+
+    return {pk: values[key] for key, pk in keys.items()}
+
+
+def books_changed(versions: dict | None) -> bool:
+    # Запись списка хранит версии своих книг на момент заполнения
+    if not versions:
+        return False
+
+    keys = {BOOK_VERSION_KEY.format(pk=pk): version
+            for pk, version in versions.items()}
+    current = cache.get_many(keys)
+
+    return any(current.get(key) != version for key, version in keys.items())
+
+
+def invalidate_books(pks: Iterable, lists: bool = True) -> None:
+    # Новая версия делает недоступными все старые ключи ответов.
+    # Версия каталога (ETag списков) меняется всегда, версия списков -
+    # только если мог измениться состав или порядок страниц. Иначе
+    # записи списков проверяются по версиям своих книг
+    version = _new_version()
+    keys = {BOOK_VERSION_KEY.format(pk=pk): version for pk in pks}
+    keys[CATALOGUE_VERSION_KEY] = version
+    if lists:
+        keys[LIST_VERSION_KEY] = version
+
+    cache.set_many(keys, None)
+
+
+def invalidate_book(pk, lists: bool = True) -> None:
+    invalidate_books([pk], lists)
+
+
+def make_response_key(name: str, version: int, query_params,
+                      variant: Iterable = ()) -> str:
+    params = urlencode(
+        [*sorted(query_params.lists()), ('variant', list(variant))],
+        doseq=True
+    )
+
+    return RESPONSE_KEY.format(
+        name=name,
+        version=version,
+        params=hashlib.md5(params.encode()).hexdigest()
+    )
+
+
+def record_hit() -> None:
+    metrics.add(HITS_KEY)
+
+
+def record_miss() -> None:
+    metrics.add(MISSES_KEY)
+
+
+def get_stats() -> dict:
+    # Счетчики всех процессов: кеш по умолчанию у каждого процесса свой
+    values = metrics.read(STATS_PREFIX)
+    hits = values.get(HITS_KEY, 0)
+    misses = values.get(MISSES_KEY, 0)
+    total = hits + misses
+
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+    }
+
+
+def reset_stats() -> None:
+    metrics.reset(STATS_PREFIX)
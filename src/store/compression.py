@@ -0,0 +1,107 @@
+import gzip
+import zlib
+from typing import Iterable, Iterator, Optional
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Уже сжатые форматы повторно не сжимаем
+COMPRESSED_TYPES = (
+    'application/gzip', 'application/zip', 'image/', 'video/', 'audio/'
+)
+
+
+def get_encodings() -> tuple:
+    # Порядок - предпочтение сервера при равном q
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def parse_accept_encoding(header: str) -> dict:
+    weights = {}
+
+    for item in header.split(','):
+        coding, *params = item.split(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        weights[coding] = quality
+
+    return weights
+
+
+def negotiate_encoding(request) -> Optional[str]:
+    weights = parse_accept_encoding(
+        request.META.get('HTTP_ACCEPT_ENCODING', '')
+    )
+    best, best_quality = None, 0.0
+
+    for encoding in get_encodings():
+        quality = weights.get(encoding, weights.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+
+    return best
+
+
+def is_compressible(response) -> bool:
+    content_type = response.get('Content-Type', '').lower()
+
+    return (
+        not response.has_header('Content-Encoding') and
+        not content_type.startswith(COMPRESSED_TYPES)
+    )
+
+
+def compress(content: bytes, encoding: str, levels: dict = None) -> bytes:
+    levels = levels or settings.COMPRESSION_LEVELS
+
+    if encoding == 'br':
+        return brotli.compress(content, quality=levels['br'])
+
+    # mtime=0: одинаковый ответ сжимается в одинаковые байты
+    return gzip.compress(content, compresslevel=levels['gzip'], mtime=0)
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = -1) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, wbits=16 + zlib.MAX_WBITS)
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+
+def brotli_stream(chunks: Iterable[bytes], quality: int) -> Iterator[bytes]:
+    compressor = brotli.Compressor(quality=quality)
+
+    for chunk in chunks:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+
+    yield compressor.finish()
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    levels = settings.COMPRESSION_LEVELS
+
+    if encoding == 'br':
+        return brotli_stream(chunks, levels['br'])
+
+    return gzip_stream(chunks, levels['gzip'])
@@ -0,0 +1,83 @@
+import csv
+import json
+from typing import Iterable, Iterator
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .compression import gzip_stream
+from .mixins.book import BookMixin, attach_reader_preview
+from .serializers import BookSerializer
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+CHUNK_SIZE = 500
+
+
+class Echo:
+    # csv.writer пишет в "файл", который просто возвращает строку
+    def write(self, value):
+        return value
+
+
+def iterate_books(queryset=None, chunk_size: int = CHUNK_SIZE):
+    if queryset is None:
+        queryset = BookMixin.get_books_queryset()
+
+    # Читатели подгружаются отдельно для каждой пачки книг
+    chunk = []
+
+    for book in queryset.order_by('pk').iterator(chunk_size=chunk_size):
+        chunk.append(book)
+
+        if len(chunk) == chunk_size:
+            yield from serialize_chunk(chunk)
+            chunk = []
+
+    yield from serialize_chunk(chunk)
+
+
+def serialize_chunk(books: list) -> Iterator[dict]:
+    attach_reader_preview(books)
+
+    for book in books:
+        yield BookSerializer(book).data
+
+
+def to_ndjson(rows: Iterable[dict]) -> Iterator[bytes]:
+    for row in rows:
+        yield json.dumps(
+            row,
+            cls=JSONEncoder,
+            ensure_ascii=False,
+            separators=(',', ':')
+        ).encode() + b'\n'
+
+
+def to_csv(rows: Iterable[dict]) -> Iterator[bytes]:
+    writer = csv.writer(Echo())
+    fields = None
+
+    for row in rows:
+        if fields is None:
+            fields = list(row)
+            yield writer.writerow(fields).encode()
+
+        row = dict(row)
+        row['reader'] = ','.join(
+            reader['username'] for reader in row['reader']
+        )
+        yield writer.writerow([row[field] for field in fields]).encode()
+
+
+def export_books(export_format: str = 'ndjson', compress: bool = False,
+                 queryset=None,
+                 chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {export_format}')
+
+    rows = iterate_books(queryset, chunk_size)
+    chunks = to_ndjson(rows) if export_format == 'ndjson' else to_csv(rows)
+
+    return gzip_stream(chunks) if compress else chunks
@@ -0,0 +1,100 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, Q
+from django_filters import rest_framework as filters
+from rest_framework.filters import OrderingFilter, SearchFilter
+
+from .models import Book
+
+
+class CharInFilter(filters.BaseInFilter, filters.CharFilter):
+    pass
+
+
+class BookFilter(filters.FilterSet):
+    # Диапазоны по индексированным колонкам: ?price_min=&price_max=
+    price_min = filters.NumberFilter(field_name='price', lookup_expr='gte')
+    price_max = filters.NumberFilter(field_name='price', lookup_expr='lte')
+    end_price_min = filters.NumberFilter(
+        field_name='end_price',
+        lookup_expr='gte'
+    )
+    end_price_max = filters.NumberFilter(
+        field_name='end_price',
+        lookup_expr='lte'
+    )
+    rating_min = filters.NumberFilter(field_name='rating', lookup_expr='gte')
+    rating_max = filters.NumberFilter(field_name='rating', lookup_expr='lte')
+    discount_min = filters.NumberFilter(
+        field_name='discount',
+        lookup_expr='gte'
+    )
+    discount_max = filters.NumberFilter(
+        field_name='discount',
+        lookup_expr='lte'
+    )
+    # ?author=Author1,Author2
+    author = CharInFilter(field_name='author', lookup_expr='in')
+    owner = filters.NumberFilter(field_name='owner_id')
+    has_discount = filters.BooleanFilter(method='filter_has_discount')
+
+    class Meta:
+        model = Book
+        fields = ['price']
+
+    def filter_has_discount(self, queryset, name, value):
+        if value:
+            return queryset.filter(discount__gt=0)
+
+        return queryset.filter(Q(discount__isnull=True) | Q(discount=0))
+
+
+class BookSearchFilter(SearchFilter):
+    # На Postgres ищем по search_vector (GIN индекс), иначе - icontains
+    search_config = 'simple'
+
+    def get_search_query(self, terms: list) -> SearchQuery | None:
+        words = [
+            word
+            for term in terms
+            for word in re.split(r'\W+', term) if word
+        ]
+
+        if not words:
+            return None
+
+        # Префиксный поиск по каждому слову
+        return SearchQuery(
+            ' & '.join(f'{word}:*' for word in words),
+            search_type='raw',
+            config=self.search_config
+        )
+
+    def filter_queryset(self, request, queryset, view):
+        if connections[queryset.db].vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        query = self.get_search_query(terms)
+        if query is None:
+            return queryset.none()
+
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        )
+
+
+class BookOrderingFilter(OrderingFilter):
+    # Без явной сортировки результаты поиска идут по релевантности
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params.get(self.ordering_param)
+
+        if not params and 'search_rank' in queryset.query.annotations:
+            return ['-search_rank']
+
+        return super().get_ordering(request, queryset, view)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from store.cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания в кеш ответов /api/book/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true')
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+
+        self.stdout.write(
+            f"hits: {stats['hits']}\n"
+            f"misses: {stats['misses']}\n"
+            f"hit ratio: {stats['hit_ratio']:.2%}"
+        )
+
+        if options['reset']:
+            reset_stats()
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+from store.profiling import (
+    get_histograms, render_prometheus, reset_histograms
+)
+
+
+def get_quantile(buckets: list, count: int, quantile: float):
+    # Верхняя граница корзины, в которую попадает квантиль
+    target = count * quantile
+    cumulative = 0
+
+    for bound, bucket_count in buckets:
+        cumulative += bucket_count
+        if cumulative >= target:
+            return bound
+
+    return '+Inf'
+
+
+class Command(BaseCommand):
+    help = 'Показывает гистограммы профилирования запросов по view'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prometheus',
+            action='store_true',
+            help='Вывести в текстовом формате Prometheus, как /metrics'
+        )
+        parser.add_argument('--reset', action='store_true')
+
+    def handle(self, *args, **options):
+        data = get_histograms()
+
+        if options['prometheus']:
+            self.stdout.write(render_prometheus(data), ending='')
+        else:
+            for view, metrics in data.items():
+                self.stdout.write(view)
+
+                for metric, histogram in metrics.items():
+                    count, buckets = histogram['count'], histogram['buckets']
+                    if not count:
+                        continue
+
+                    p50 = get_quantile(buckets, count, 0.5)
+                    p95 = get_quantile(buckets, count, 0.95)
+                    self.stdout.write(
+                        f"  {metric:<10} count={count:<6} "
+                        f"avg={histogram['sum'] / count:.4f} "
+                        f"p50<={p50} p95<={p95}"
+                    )
+
+        if options['reset']:
+            reset_histograms()
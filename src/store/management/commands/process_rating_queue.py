@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.utils import drain_rating_queue
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинг книг из очереди BookRatingTask'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=None,
+            help='Пауза между проходами, по умолчанию RATING_FLUSH_LATENCY'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Разобрать очередь один раз и завершиться'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if interval is None:
+            interval = settings.RATING_FLUSH_LATENCY
+
+        while True:
+            processed = drain_rating_queue(options['batch_size'])
+
+            if processed:
+                self.stdout.write(f'Пересчитано книг: {processed}')
+            if options['once']:
+                break
+
+            time.sleep(interval)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from store.utils import rebuild_book_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики лайков, закладок и читателей у книг'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = rebuild_book_counters(batch_size=options['batch_size'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Обновлено книг: {updated}')
+        )
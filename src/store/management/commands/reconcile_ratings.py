@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from store.utils import reconcile_book_ratings
+
+
+class Command(BaseCommand):
+    help = 'Исправляет расхождения в сумме и количестве оценок книг'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        repaired = reconcile_book_ratings(batch_size=options['batch_size'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Исправлено книг: {repaired}')
+        )
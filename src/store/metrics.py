@@ -0,0 +1,97 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Таблица store.Metric. Запросы сырые: модуль не зависит от моделей,
+# а запись мимо роутера не закрепляет запрос за основной базой
+TABLE = 'store_metric'
+# Строк в одном INSERT, чтобы не упереться в лимит параметров SQLite
+BATCH_SIZE = 400
+
+
+def increment(values: dict) -> None:
+    # Атомарное приращение, параллельные процессы не теряют значения.
+    # Ключи сортируются, чтобы транзакции блокировали строки в одном
+    # порядке
+    items = sorted(values.items())
+    connection = connections[DEFAULT_DB_ALIAS]
+    table = connection.ops.quote_name(TABLE)
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), BATCH_SIZE):
+            batch = items[start:start + BATCH_SIZE]
+            cursor.execute(
+                f'INSERT INTO {table} ("name", "value") VALUES '
+                + ', '.join(['(%s, %s)'] * len(batch))
+                + ' ON CONFLICT ("name") DO UPDATE'
+                f' SET "value" = {table}."value" + EXCLUDED."value"',
+                [param for item in batch for param in item]
+            )
+
+
+def _execute_by_prefix(action: str, prefix: str):
+    connection = connections[DEFAULT_DB_ALIAS]
+    table = connection.ops.quote_name(TABLE)
+    cursor = connection.cursor()
+
+    cursor.execute(
+        f"{action} FROM {table} WHERE \"name\" LIKE %s ESCAPE '\\'",
+        [connection.ops.prep_for_like_query(prefix) + '%']
+    )
+    return cursor
+
+
+def read(prefix: str) -> dict:
+    with _execute_by_prefix('SELECT "name", "value"', prefix) as cursor:
+        return dict(cursor.fetchall())
+
+
+def delete(prefix: str) -> None:
+    _execute_by_prefix('DELETE', prefix).close()
+
+
+class MetricBuffer:
+    # Приращения копятся в процессе и не чаще раза в METRICS_FLUSH_SECONDS
+    # сливаются в базу одним INSERT ... ON CONFLICT, откуда их читают
+    # все процессы и команды. Несброшенное при остановке теряется
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.flushed_at = time.monotonic()
+
+    def add_many(self, values: dict) -> None:
+        with self.lock:
+            for name, value in values.items():
+                self.pending[name] = self.pending.get(name, 0) + value
+
+        elapsed = time.monotonic() - self.flushed_at
+        if elapsed >= settings.METRICS_FLUSH_SECONDS:
+            self.flush()
+
+    def add(self, name: str, value: int = 1) -> None:
+        self.add_many({name: value})
+
+    def flush(self) -> None:
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.monotonic()
+
+        if pending:
+            increment(pending)
+
+    def read(self, prefix: str) -> dict:
+        self.flush()
+        return read(prefix)
+
+    def reset(self, prefix: str) -> None:
+        with self.lock:
+            self.pending = {
+                name: value for name, value in self.pending.items()
+                if not name.startswith(prefix)
+            }
+        delete(prefix)
+
+
+metrics = MetricBuffer()
@@ -0,0 +1,161 @@
+import asyncio
+import cProfile
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.deprecation import MiddlewareMixin
+
+from . import compression, profiling, routers
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'primary_pin'
+
+
+def use_replica(request) -> bool:
+    # Пока кука жива, пользователь читает свои записи с основной базы
+    return (
+        request.method in SAFE_METHODS and
+        PIN_COOKIE not in request.COOKIES
+    )
+
+
+def pin_response(response, wrote: bool):
+    # Кука покрывает отставание реплики после записи
+    if wrote:
+        response.set_cookie(
+            PIN_COOKIE,
+            '1',
+            max_age=settings.REPLICA_PIN_SECONDS,
+            httponly=True,
+            samesite='Lax'
+        )
+
+    return response
+
+
+@sync_and_async_middleware
+def replica_pinning_middleware(get_response):
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = routers.begin_request(use_replica(request))
+            try:
+                response = await get_response(request)
+            finally:
+                wrote = routers.end_request(token)
+
+            return pin_response(response, wrote)
+    else:
+        def middleware(request):
+            token = routers.begin_request(use_replica(request))
+            try:
+                response = get_response(request)
+            finally:
+                wrote = routers.end_request(token)
+
+            return pin_response(response, wrote)
+
+    return middleware
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    # Включается PROFILING_ENABLED: метрики запроса - в Server-Timing
+    # и гистограммы по view
+    def process_request(self, request):
+        profiling.install_wrappers()
+        request.profile = profiling.begin_profile()
+        request.profile_start = time.perf_counter()
+        request.profiler = None
+
+        # cProfile - для доли синхронных запросов, сохраняются медленные
+        if (not asyncio.iscoroutinefunction(self.get_response) and
+                random.random() < settings.PROFILING_SAMPLE_RATE):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except (RuntimeError, ValueError):
+                # Профилировщик уже запущен
+                return
+            request.profiler = profiler
+
+    def process_template_response(self, request, response):
+        # DRF отдает ответ, который Django рендерит после view
+        start = time.perf_counter()
+        response.add_post_render_callback(
+            lambda rendered: request.profile.add(
+                'render', time.perf_counter() - start
+            )
+        )
+
+        return response
+
+    def process_response(self, request, response):
+        profile = getattr(request, 'profile', None)
+        if profile is None:
+            return response
+
+        profiler = request.profiler
+        if profiler is not None:
+            profiler.disable()
+
+        profiling.end_profile()
+        total = time.perf_counter() - request.profile_start
+        view = profiling.get_view_name(request)
+
+        profiling.observe(view, profile, total)
+        response['Server-Timing'] = profile.server_timing(total)
+
+        if profiler is not None and total >= settings.PROFILING_SLOW_SECONDS:
+            path = profiling.save_profile(profiler, view)
+            logger.warning(
+                'Slow request %s %s (%.3fs), profile: %s',
+                request.method, request.path, total, path
+            )
+
+        return response
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    # Сжатие br или gzip по Accept-Encoding. Ответы из кеша книг приходят
+    # уже сжатыми (есть Content-Encoding) и пропускаются
+    def process_response(self, request, response):
+        if not compression.is_compressible(response):
+            return response
+
+        if (not response.streaming and
+                len(response.content) < settings.COMPRESSION_MIN_SIZE):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = compression.negotiate_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            # Выгрузка сжимается по мере генерации, длина заранее неизвестна
+            response.streaming_content = compression.compress_stream(
+                response.streaming_content, encoding
+            )
+            del response['Content-Length']
+        else:
+            content = compression.compress(response.content, encoding)
+            if len(content) >= len(response.content):
+                return response
+
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        # Сжатые байты отличаются от исходных, тег становится слабым
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+
+        response['Content-Encoding'] = encoding
+
+        return response
@@ -0,0 +1,51 @@
+# Generated by Django 4.1.1 on 2026-10-18 08:34
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+
+    def count_relations(**filters):
+        relations = UserBookRelation.objects.filter(
+            book=OuterRef('pk'),
+            **filters
+        ).order_by().values('book').annotate(
+            count=Count('pk')
+        ).values('count')
+        return Coalesce(Subquery(relations), Value(0))
+
+    Book.objects.update(
+        count_likes=count_relations(like=True),
+        count_bookmarks=count_relations(is_bookmark=True),
+        count_readers=count_relations(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_book_rating_alter_book_discount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='count_bookmarks',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='count_likes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='count_readers',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.1.1 on 2026-10-18 08:36
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_sum(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+
+    rates = UserBookRelation.objects.filter(
+        book=OuterRef('pk'),
+        rate__isnull=False
+    ).order_by().values('book')
+
+    Book.objects.update(
+        rating_sum=Coalesce(
+            Subquery(rates.annotate(value=Sum('rate')).values('value')),
+            Value(0)
+        ),
+        rating_count=Coalesce(
+            Subquery(rates.annotate(value=Count('rate')).values('value')),
+            Value(0)
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_book_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_rating_sum, migrations.RunPython.noop),
+    ]
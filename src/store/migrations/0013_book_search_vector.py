@@ -0,0 +1,59 @@
+# Generated by Django 4.1.1 on 2026-10-18 08:44
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+CREATE_SEARCH = [
+    """
+    CREATE INDEX store_book_search_vector_idx
+    ON store_book USING gin (search_vector)
+    """,
+    """
+    CREATE TRIGGER store_book_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, author ON store_book
+    FOR EACH ROW EXECUTE PROCEDURE
+    tsvector_update_trigger(search_vector, 'pg_catalog.simple', name, author)
+    """,
+    """
+    UPDATE store_book SET search_vector = to_tsvector(
+        'pg_catalog.simple',
+        coalesce(name, '') || ' ' || coalesce(author, '')
+    )
+    """,
+]
+
+DROP_SEARCH = [
+    'DROP TRIGGER IF EXISTS store_book_search_vector_trigger ON store_book',
+    'DROP INDEX IF EXISTS store_book_search_vector_idx',
+]
+
+
+def run_postgres(statements):
+    # GIN индекс и триггер есть только в Postgres, на SQLite поле пустое
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_book_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            run_postgres(CREATE_SEARCH),
+            run_postgres(DROP_SEARCH)
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 4.1.1 on 2026-10-18 08:40
+
+from string import Formatter
+
+from django.db import migrations, models
+from django.db.models import (
+    Case, Count, DecimalField, Func, Min, OuterRef, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan
+
+
+class RatingAverage(Func):
+    # Копия store.utils.RatingAverage: sum / count с округлением до сотых
+    # половиной к четному
+    template = (
+        'CAST(({sum}) * 100 / ({count}) + CASE'
+        ' WHEN 2 * (({sum}) * 100 %% ({count})) > ({count})'
+        ' OR (2 * (({sum}) * 100 %% ({count})) = ({count})'
+        ' AND ({sum}) * 100 / ({count}) %% 2 = 1)'
+        ' THEN 1 ELSE 0 END AS INTEGER) / 100.0'
+    )
+    output_field = DecimalField(max_digits=3, decimal_places=2)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        compiled = dict(zip(
+            ('sum', 'count'),
+            (compiler.compile(arg) for arg in self.get_source_expressions())
+        ))
+        sql, params = [], []
+
+        for literal, name, _, _ in Formatter().parse(self.template):
+            sql.append(literal)
+            if name:
+                sql.append(compiled[name][0])
+                params.extend(compiled[name][1])
+
+        return ''.join(sql), params
+
+
+def remove_duplicates(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+
+    duplicates = UserBookRelation.objects.values('user', 'book').annotate(
+        first_id=Min('id'),
+        count=Count('id')
+    ).filter(count__gt=1).order_by()
+
+    book_ids = set()
+    for duplicate in duplicates:
+        UserBookRelation.objects.filter(
+            user=duplicate['user'],
+            book=duplicate['book']
+        ).exclude(id=duplicate['first_id']).delete()
+        book_ids.add(duplicate['book'])
+
+    if not book_ids:
+        return
+
+    def aggregate(value, **filters):
+        relations = UserBookRelation.objects.filter(
+            book=OuterRef('pk'),
+            **filters
+        ).order_by().values('book').annotate(
+            value=value
+        ).values('value')
+        return Coalesce(Subquery(relations), Value(0))
+
+    rating_sum = aggregate(Sum('rate'), rate__isnull=False)
+    rating_count = aggregate(Count('rate'), rate__isnull=False)
+
+    # Счетчики и рейтинг книг с удаленными дублями
+    Book.objects.filter(pk__in=book_ids).update(
+        count_likes=aggregate(Count('id'), like=True),
+        count_bookmarks=aggregate(Count('id'), is_bookmark=True),
+        count_readers=aggregate(Count('id')),
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        # UPDATE видит старые значения колонок, поэтому рейтинг считается
+        # из тех же подзапросов
+        rating=Case(
+            When(
+                GreaterThan(rating_count, 0),
+                then=RatingAverage(rating_sum, rating_count)
+            ),
+            default=Value(None),
+            output_field=DecimalField(max_digits=3, decimal_places=2)
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_book_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userbookrelation',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='store_unique_user_book'),
+        ),
+    ]
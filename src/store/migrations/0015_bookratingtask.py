@@ -0,0 +1,21 @@
+# Generated by Django 4.1.1 on 2026-10-18 08:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_userbookrelation_unique_user_book'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookRatingTask',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_task', serialize=False, to='store.book')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.1 on 2026-10-18 08:45
+
+from django.db import migrations, models
+from django.db.models import Case, F, When
+
+
+def fill_end_price(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+
+    Book.objects.update(end_price=Case(
+        When(discount__gt=0, then=F('price') * (1 - F('discount'))),
+        default=F('price')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_bookratingtask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='end_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=7),
+        ),
+        migrations.RunPython(fill_end_price, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['end_price', 'id'], name='store_book_end_price_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.1 on 2026-10-18 09:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_relation_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(fields=['book', 'id'], name='store_relation_book_id_idx'),
+        ),
+    ]
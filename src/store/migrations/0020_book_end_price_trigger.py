@@ -0,0 +1,105 @@
+from decimal import Decimal, ROUND_HALF_EVEN
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+CREATE_END_PRICE = [
+    # Банковское округление до копеек, как Decimal.quantize(ROUND_HALF_EVEN)
+    # в Book.get_end_price. round() в Postgres округляет половину от нуля
+    """
+    CREATE FUNCTION store_book_end_price(price numeric, discount numeric)
+    RETURNS numeric AS $$
+        SELECT CASE
+            WHEN discount IS NULL OR discount <= 0 THEN price
+            ELSE (
+                SELECT (CASE
+                    WHEN cents - floor(cents) > 0.5 OR (
+                        cents - floor(cents) = 0.5 AND
+                        mod(floor(cents), 2) <> 0
+                    ) THEN floor(cents) + 1
+                    ELSE floor(cents)
+                END) / 100
+                FROM (SELECT price * (1 - discount) * 100 AS cents) scaled
+            )
+        END
+    $$ LANGUAGE sql IMMUTABLE
+    """,
+    """
+    CREATE FUNCTION store_book_end_price_trigger() RETURNS trigger AS $$
+    BEGIN
+        NEW.end_price := store_book_end_price(NEW.price, NEW.discount);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER store_book_end_price_trigger
+    BEFORE INSERT OR UPDATE OF price, discount, end_price ON store_book
+    FOR EACH ROW EXECUTE PROCEDURE store_book_end_price_trigger()
+    """,
+    """
+    UPDATE store_book
+    SET end_price = store_book_end_price(price, discount)
+    WHERE end_price IS DISTINCT FROM store_book_end_price(price, discount)
+    """,
+]
+
+DROP_END_PRICE = [
+    'DROP TRIGGER IF EXISTS store_book_end_price_trigger ON store_book',
+    'DROP FUNCTION IF EXISTS store_book_end_price_trigger()',
+    'DROP FUNCTION IF EXISTS store_book_end_price(numeric, numeric)',
+]
+
+
+def get_end_price(price: Decimal, discount: Decimal | None) -> Decimal:
+    if discount and discount > 0:
+        return (price * (1 - discount)).quantize(
+            Decimal('0.01'),
+            rounding=ROUND_HALF_EVEN
+        )
+
+    return price
+
+
+def create_end_price(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in CREATE_END_PRICE:
+            schema_editor.execute(statement)
+        return
+
+    # Без триггера: 0016 заполнила цену другим округлением
+    Book = apps.get_model('store', 'Book')
+    books = Book.objects.only('price', 'discount', 'end_price').order_by('pk')
+    changed = []
+
+    for book in books.iterator(chunk_size=BATCH_SIZE):
+        end_price = get_end_price(book.price, book.discount)
+        if end_price != book.end_price:
+            book.end_price = end_price
+            changed.append(book)
+
+        if len(changed) == BATCH_SIZE:
+            Book.objects.bulk_update(changed, ['end_price'])
+            changed = []
+
+    Book.objects.bulk_update(changed, ['end_price'])
+
+
+def drop_end_price(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for statement in DROP_END_PRICE:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0019_relation_book_id_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_end_price, drop_end_price),
+    ]
@@ -0,0 +1,195 @@
+from django.db import migrations
+
+# Счетчики книги меняет триггер на store_userbookrelation, поэтому они
+# верны и после update(), bulk_create(), bulk_update() и raw SQL.
+# "like" - ключевое слово, колонку нужно брать в кавычки
+CREATE_COUNTERS_POSTGRES = [
+    """
+    CREATE FUNCTION store_relation_book_stats() RETURNS trigger AS $$
+    BEGIN
+        -- OLD при INSERT не определен, поэтому условия вложены
+        IF TG_OP = 'UPDATE' THEN
+            IF OLD.book_id = NEW.book_id THEN
+                UPDATE store_book SET
+                    count_likes = count_likes
+                        + NEW."like"::int - OLD."like"::int,
+                    count_bookmarks = count_bookmarks
+                        + NEW.is_bookmark::int - OLD.is_bookmark::int,
+                    updated_at = now()
+                WHERE id = NEW.book_id;
+                RETURN NULL;
+            END IF;
+        END IF;
+
+        IF TG_OP <> 'INSERT' THEN
+            UPDATE store_book SET
+                count_likes = count_likes - OLD."like"::int,
+                count_bookmarks = count_bookmarks - OLD.is_bookmark::int,
+                count_readers = count_readers - 1,
+                updated_at = now()
+            WHERE id = OLD.book_id;
+        END IF;
+
+        IF TG_OP <> 'DELETE' THEN
+            UPDATE store_book SET
+                count_likes = count_likes + NEW."like"::int,
+                count_bookmarks = count_bookmarks + NEW.is_bookmark::int,
+                count_readers = count_readers + 1,
+                updated_at = now()
+            WHERE id = NEW.book_id;
+        END IF;
+
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER store_relation_book_stats
+    AFTER INSERT OR DELETE ON store_userbookrelation
+    FOR EACH ROW EXECUTE PROCEDURE store_relation_book_stats()
+    """,
+    # Сохранение связи без изменений книгу не трогает
+    """
+    CREATE TRIGGER store_relation_book_stats_update
+    AFTER UPDATE ON store_userbookrelation
+    FOR EACH ROW WHEN (
+        (OLD.book_id, OLD."like", OLD.is_bookmark)
+        IS DISTINCT FROM (NEW.book_id, NEW."like", NEW.is_bookmark)
+    )
+    EXECUTE PROCEDURE store_relation_book_stats()
+    """,
+]
+
+DROP_COUNTERS_POSTGRES = [
+    'DROP TRIGGER IF EXISTS store_relation_book_stats_update'
+    ' ON store_userbookrelation',
+    'DROP TRIGGER IF EXISTS store_relation_book_stats'
+    ' ON store_userbookrelation',
+    'DROP FUNCTION IF EXISTS store_relation_book_stats()',
+]
+
+# В SQLite нет IF в теле триггера: ветки разнесены по триггерам и
+# условиям WHERE. Булевы колонки хранятся как 0 и 1. Миграции, которые
+# пересоздают store_userbookrelation в SQLite, удаляют и эти триггеры
+SQLITE_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+CREATE_COUNTERS_SQLITE = [
+    f"""
+    CREATE TRIGGER store_relation_book_stats_insert
+    AFTER INSERT ON store_userbookrelation
+    BEGIN
+        UPDATE store_book SET
+            count_likes = count_likes + NEW."like",
+            count_bookmarks = count_bookmarks + NEW.is_bookmark,
+            count_readers = count_readers + 1,
+            updated_at = {SQLITE_NOW}
+        WHERE id = NEW.book_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER store_relation_book_stats_delete
+    AFTER DELETE ON store_userbookrelation
+    BEGIN
+        UPDATE store_book SET
+            count_likes = count_likes - OLD."like",
+            count_bookmarks = count_bookmarks - OLD.is_bookmark,
+            count_readers = count_readers - 1,
+            updated_at = {SQLITE_NOW}
+        WHERE id = OLD.book_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER store_relation_book_stats_update
+    AFTER UPDATE ON store_userbookrelation
+    WHEN OLD.book_id IS NOT NEW.book_id
+        OR OLD."like" IS NOT NEW."like"
+        OR OLD.is_bookmark IS NOT NEW.is_bookmark
+    BEGIN
+        UPDATE store_book SET
+            count_likes = count_likes + NEW."like" - OLD."like",
+            count_bookmarks = count_bookmarks
+                + NEW.is_bookmark - OLD.is_bookmark,
+            updated_at = {SQLITE_NOW}
+        WHERE id = NEW.book_id AND OLD.book_id = NEW.book_id;
+
+        UPDATE store_book SET
+            count_likes = count_likes - OLD."like",
+            count_bookmarks = count_bookmarks - OLD.is_bookmark,
+            count_readers = count_readers - 1,
+            updated_at = {SQLITE_NOW}
+        WHERE id = OLD.book_id AND OLD.book_id <> NEW.book_id;
+
+        UPDATE store_book SET
+            count_likes = count_likes + NEW."like",
+            count_bookmarks = count_bookmarks + NEW.is_bookmark,
+            count_readers = count_readers + 1,
+            updated_at = {SQLITE_NOW}
+        WHERE id = NEW.book_id AND OLD.book_id <> NEW.book_id;
+    END
+    """,
+]
+
+DROP_COUNTERS_SQLITE = [
+    'DROP TRIGGER IF EXISTS store_relation_book_stats_update',
+    'DROP TRIGGER IF EXISTS store_relation_book_stats_delete',
+    'DROP TRIGGER IF EXISTS store_relation_book_stats_insert',
+]
+
+# Раньше счетчики могли разойтись после update() и bulk-операций
+REBUILD_COUNTERS = """
+    UPDATE store_book SET
+        count_likes = (
+            SELECT COUNT(*) FROM store_userbookrelation relation
+            WHERE relation.book_id = store_book.id AND relation."like"
+        ),
+        count_bookmarks = (
+            SELECT COUNT(*) FROM store_userbookrelation relation
+            WHERE relation.book_id = store_book.id AND relation.is_bookmark
+        ),
+        count_readers = (
+            SELECT COUNT(*) FROM store_userbookrelation relation
+            WHERE relation.book_id = store_book.id
+        )
+"""
+
+
+def get_statements(connection, postgres, sqlite):
+    if connection.vendor == 'postgresql':
+        return postgres
+    if connection.vendor == 'sqlite':
+        return sqlite
+
+    raise NotImplementedError(
+        f'Триггер счетчиков не реализован для {connection.vendor}'
+    )
+
+
+def create_counters(apps, schema_editor):
+    statements = get_statements(
+        schema_editor.connection,
+        CREATE_COUNTERS_POSTGRES,
+        CREATE_COUNTERS_SQLITE
+    )
+    for statement in [*statements, REBUILD_COUNTERS]:
+        schema_editor.execute(statement)
+
+
+def drop_counters(apps, schema_editor):
+    statements = get_statements(
+        schema_editor.connection,
+        DROP_COUNTERS_POSTGRES,
+        DROP_COUNTERS_SQLITE
+    )
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_book_end_price_trigger'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_counters, drop_counters),
+    ]
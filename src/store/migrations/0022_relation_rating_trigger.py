@@ -0,0 +1,243 @@
+from importlib import import_module
+
+from django.db import migrations
+
+# Триггер из 0021 дополнительно ведет rating_sum, rating_count и rating
+counters = import_module('store.migrations.0021_relation_counters_trigger')
+
+
+def get_rating_sql(total: str, count: str, mod) -> str:
+    # Половина к четному целочисленно, как store.utils.RatingAverage
+    cents = f'({total}) * 100'
+    rest = f'2 * {mod(cents, count)}'
+
+    return f"""CASE WHEN ({count}) > 0 THEN (
+        {cents} / ({count}) + CASE
+            WHEN {rest} > ({count}) OR (
+                {rest} = ({count}) AND {mod(f'{cents} / ({count})', '2')} = 1
+            ) THEN 1 ELSE 0
+        END
+    ) / 100.0 END"""
+
+
+def get_add_stats_sql(now: str, book, likes, bookmarks, readers, rates,
+                      rated, mod) -> str:
+    return f"""
+        UPDATE store_book SET
+            count_likes = count_likes + {likes},
+            count_bookmarks = count_bookmarks + {bookmarks},
+            count_readers = count_readers + {readers},
+            rating_sum = rating_sum + {rates},
+            rating_count = rating_count + {rated},
+            rating = {get_rating_sql(
+                f'rating_sum + {rates}', f'rating_count + {rated}', mod
+            )},
+            updated_at = {now}
+        WHERE id = {book}"""
+
+
+def postgres_mod(left: str, right: str) -> str:
+    return f'mod({left}, {right})'
+
+
+def sqlite_mod(left: str, right: str) -> str:
+    return f'(({left}) % ({right}))'
+
+
+CREATE_RATING_POSTGRES = [
+    # Параметры названы не как колонки: в SQL-функции колонка важнее
+    f"""
+    CREATE FUNCTION store_book_add_stats(
+        book_pk bigint, likes int, bookmarks int, readers int,
+        rates int, rated int
+    ) RETURNS void AS $$
+        {get_add_stats_sql(
+            'now()', 'book_pk', 'likes', 'bookmarks', 'readers', 'rates',
+            'rated', postgres_mod
+        )}
+    $$ LANGUAGE sql
+    """,
+    """
+    CREATE FUNCTION store_relation_book_stats() RETURNS trigger AS $$
+    BEGIN
+        -- OLD при INSERT не определен, поэтому условия вложены
+        IF TG_OP = 'UPDATE' THEN
+            IF OLD.book_id = NEW.book_id THEN
+                PERFORM store_book_add_stats(
+                    NEW.book_id,
+                    NEW."like"::int - OLD."like"::int,
+                    NEW.is_bookmark::int - OLD.is_bookmark::int,
+                    0,
+                    coalesce(NEW.rate, 0) - coalesce(OLD.rate, 0),
+                    (NEW.rate IS NOT NULL)::int - (OLD.rate IS NOT NULL)::int
+                );
+                RETURN NULL;
+            END IF;
+        END IF;
+
+        IF TG_OP <> 'INSERT' THEN
+            PERFORM store_book_add_stats(
+                OLD.book_id,
+                -OLD."like"::int,
+                -OLD.is_bookmark::int,
+                -1,
+                -coalesce(OLD.rate, 0),
+                -(OLD.rate IS NOT NULL)::int
+            );
+        END IF;
+
+        IF TG_OP <> 'DELETE' THEN
+            PERFORM store_book_add_stats(
+                NEW.book_id,
+                NEW."like"::int,
+                NEW.is_bookmark::int,
+                1,
+                coalesce(NEW.rate, 0),
+                (NEW.rate IS NOT NULL)::int
+            );
+        END IF;
+
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER store_relation_book_stats
+    AFTER INSERT OR DELETE ON store_userbookrelation
+    FOR EACH ROW EXECUTE PROCEDURE store_relation_book_stats()
+    """,
+    """
+    CREATE TRIGGER store_relation_book_stats_update
+    AFTER UPDATE ON store_userbookrelation
+    FOR EACH ROW WHEN (
+        (OLD.book_id, OLD."like", OLD.is_bookmark, OLD.rate)
+        IS DISTINCT FROM (NEW.book_id, NEW."like", NEW.is_bookmark, NEW.rate)
+    )
+    EXECUTE PROCEDURE store_relation_book_stats()
+    """,
+]
+
+DROP_RATING_POSTGRES = [
+    *counters.DROP_COUNTERS_POSTGRES,
+    'DROP FUNCTION IF EXISTS'
+    ' store_book_add_stats(bigint, int, int, int, int, int)',
+]
+
+
+def sqlite_add_stats(book, likes, bookmarks, readers, rates, rated) -> str:
+    return get_add_stats_sql(
+        counters.SQLITE_NOW, book, likes, bookmarks, readers, rates, rated,
+        sqlite_mod
+    )
+
+
+SQLITE_NEW = [
+    'NEW."like"',
+    'NEW.is_bookmark',
+    '1',
+    'coalesce(NEW.rate, 0)',
+    '(NEW.rate IS NOT NULL)',
+]
+SQLITE_OLD = [
+    '-OLD."like"',
+    '-OLD.is_bookmark',
+    '-1',
+    '-coalesce(OLD.rate, 0)',
+    '-(OLD.rate IS NOT NULL)',
+]
+SQLITE_CHANGE = [
+    f'{new} + {old}' for new, old in zip(SQLITE_NEW, SQLITE_OLD)
+]
+
+CREATE_RATING_SQLITE = [
+    f"""
+    CREATE TRIGGER store_relation_book_stats_insert
+    AFTER INSERT ON store_userbookrelation
+    BEGIN
+        {sqlite_add_stats('NEW.book_id', *SQLITE_NEW)};
+    END
+    """,
+    f"""
+    CREATE TRIGGER store_relation_book_stats_delete
+    AFTER DELETE ON store_userbookrelation
+    BEGIN
+        {sqlite_add_stats('OLD.book_id', *SQLITE_OLD)};
+    END
+    """,
+    f"""
+    CREATE TRIGGER store_relation_book_stats_update
+    AFTER UPDATE ON store_userbookrelation
+    WHEN OLD.book_id IS NOT NEW.book_id
+        OR OLD."like" IS NOT NEW."like"
+        OR OLD.is_bookmark IS NOT NEW.is_bookmark
+        OR OLD.rate IS NOT NEW.rate
+    BEGIN
+        {sqlite_add_stats('NEW.book_id', *SQLITE_CHANGE)}
+            AND OLD.book_id = NEW.book_id;
+        {sqlite_add_stats('OLD.book_id', *SQLITE_OLD)}
+            AND OLD.book_id <> NEW.book_id;
+        {sqlite_add_stats('NEW.book_id', *SQLITE_NEW)}
+            AND OLD.book_id <> NEW.book_id;
+    END
+    """,
+]
+
+# Раньше сумма и количество оценок расходились после bulk-операций
+REBUILD_RATING_SUM = """
+    UPDATE store_book SET
+        rating_sum = (
+            SELECT coalesce(SUM(relation.rate), 0)
+            FROM store_userbookrelation relation
+            WHERE relation.book_id = store_book.id
+        ),
+        rating_count = (
+            SELECT COUNT(relation.rate) FROM store_userbookrelation relation
+            WHERE relation.book_id = store_book.id
+        )
+"""
+
+
+def get_rebuild_rating(mod) -> str:
+    return (
+        'UPDATE store_book SET rating = '
+        + get_rating_sql('rating_sum', 'rating_count', mod)
+    )
+
+
+def create_rating(apps, schema_editor):
+    statements = counters.get_statements(
+        schema_editor.connection,
+        [
+            *DROP_RATING_POSTGRES,
+            *CREATE_RATING_POSTGRES,
+            get_rebuild_rating(postgres_mod),
+        ],
+        [
+            *counters.DROP_COUNTERS_SQLITE,
+            *CREATE_RATING_SQLITE,
+            get_rebuild_rating(sqlite_mod),
+        ]
+    )
+    for statement in [REBUILD_RATING_SUM, *statements]:
+        schema_editor.execute(statement)
+
+
+def drop_rating(apps, schema_editor):
+    statements = counters.get_statements(
+        schema_editor.connection,
+        [*DROP_RATING_POSTGRES, *counters.CREATE_COUNTERS_POSTGRES],
+        [*counters.DROP_COUNTERS_SQLITE, *counters.CREATE_COUNTERS_SQLITE]
+    )
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_relation_counters_trigger'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_rating, drop_rating),
+    ]
@@ -1,32 +1,104 @@
-from django.db.models import Count, Case, When, Value, F
-from typing import Sequence
+from django.db.models import F, FilteredRelation, Q, Window
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from typing import Iterable, Sequence
 
-from store.models import Book
+from store.models import Book, UserBookRelation
+
+# Состояние связи текущего пользователя с книгой: поле выдачи -> поле связи
+USER_RELATION_FIELDS = {
+    'my_like': 'like',
+    'my_bookmark': 'is_bookmark',
+    'my_rate': 'rate',
+}
+
+# Столбцы книги, которые можно выбрать через only()
+BOOK_COLUMNS = {field.name for field in Book._meta.concrete_fields}
+
+# Сколько читателей отдаем вместе с книгой, остальные - через /readers/
+READERS_PREVIEW_SIZE = 5
+
+
+def get_reader_preview_queryset(book_ids: Iterable,
+                                size: int = READERS_PREVIEW_SIZE):
+    # Первые size связей каждой книги одним запросом на все книги.
+    # ROW_NUMBER() считается только по связям этих книг, по индексу
+    # (book_id, id), а не коррелированным подзапросом на каждую связь
+    book_ids = list(book_ids)
+    if not book_ids:
+        return UserBookRelation.objects.none()
+
+    numbered = UserBookRelation.objects.filter(
+        book_id__in=book_ids
+    ).annotate(
+        position=Window(
+            RowNumber(),
+            partition_by=F('book_id'),
+            order_by=F('pk').asc()
+        )
+    ).values('pk', 'position')
+    # Фильтр по оконной функции ORM умеет только с Django 4.2
+    sql, params = numbered.query.sql_with_params()
+
+    return UserBookRelation.objects.filter(
+        pk__in=RawSQL(
+            f'SELECT "id" FROM ({sql}) "numbered" WHERE "position" <= %s',
+            (*params, size)
+        )
+    ).select_related('user').only(
+        'book', 'user__username'
+    ).order_by('pk')
+
+
+def attach_reader_preview(books: list) -> None:
+    previews = {book.pk: [] for book in books}
+    if not previews:
+        return
+
+    for relation in get_reader_preview_queryset(previews):
+        previews[relation.book_id].append(relation)
+
+    for book in books:
+        book.reader_preview = previews[book.pk]
 
 
 class BookMixin:
     @classmethod
-    def get_books_queryset(cls) -> Sequence:
-        queryset = Book.objects.all().annotate(
-
-            count_likes=Count(Case(When(
-                userbookrelation__like=True,
-                then=Value(1)
-            ))),
-
-            count_bookmarks=Count(Case(When(
-                userbookrelation__is_bookmark=True,
-                then=Value(1)
-            ))),
-
-            owner_name=F('owner__username'),
-
-            end_price=Case(
-                When(
-                    discount__gt=0,
-                    then=F('price') * (1 - F('discount'))),
-                default=F('price')
+    def get_books_queryset(cls, user=None, fields=None) -> Sequence:
+        # fields - выбранные поля выдачи (?fields=, ?omit=), None - все.
+        # JOIN, аннотации и prefetch добавляются только под нужные поля
+        def wanted(name: str) -> bool:
+            return fields is None or name in fields
+
+        queryset = Book.objects.all()
+
+        # Счетчики и end_price хранятся в самой книге
+        if fields is None:
+            queryset = queryset.defer('search_vector')
+        else:
+            queryset = queryset.only('id', *(
+                name for name in fields if name in BOOK_COLUMNS
+            ))
+
+        if wanted('owner_name'):
+            queryset = queryset.annotate(owner_name=F('owner__username'))
+
+        # Анонимам - без лишнего JOIN, пользователю - одним LEFT JOIN
+        # на его связь (пара user, book уникальна, строки не дублируются)
+        relation_fields = {
+            name: field for name, field in USER_RELATION_FIELDS.items()
+            if wanted(name)
+        }
+        if relation_fields and user is not None and user.is_authenticated:
+            queryset = queryset.annotate(
+                my_relation=FilteredRelation(
+                    'userbookrelation',
+                    condition=Q(userbookrelation__user=user)
+                ),
+                **{
+                    name: F(f'my_relation__{field}')
+                    for name, field in relation_fields.items()
+                }
             )
-        ).select_related('owner').prefetch_related('reader')
 
         return queryset
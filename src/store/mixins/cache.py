@@ -0,0 +1,147 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework import status
+
+from store.cache import (
+    books_changed, get_book_version, get_book_versions, get_list_version,
+    make_response_key, record_hit, record_miss
+)
+from store.compression import compress, negotiate_encoding
+from store.profiling import timer
+from store.routers import use_primary
+
+
+class BookCacheMixin:
+    # Кешируем только анонимные GET, ответы пользователям могут отличаться.
+    # HTML Browsable API содержит CSRF-токен и в кеш не попадает
+    def is_cacheable(self, request) -> bool:
+        return (
+            request.method == 'GET' and
+            not request.user.is_authenticated and
+            request.accepted_renderer.format != 'api'
+        )
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            'list',
+            get_list_version,
+            super().list,
+            request, *args, track_books=True, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+
+        return self.get_cached_response(
+            f'detail:{pk}',
+            lambda: get_book_version(pk),
+            super().retrieve,
+            request, *args, **kwargs
+        )
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+
+        # Книги страницы: запись списка проверяется по их версиям
+        if page is not None and self.action == 'list':
+            self.page_book_ids = [
+                item['id'] if isinstance(item, dict) else item.pk
+                for item in page
+            ]
+
+        return page
+
+    def get_cached_response(self, name, get_version, view, request,
+                            *args, track_books=False, **kwargs):
+        if not self.is_cacheable(request):
+            return view(request, *args, **kwargs)
+
+        # Храним готовые байты: на попадании нет ни рендера, ни сжатия.
+        # Ключ различается форматом и кодировкой
+        encoding = negotiate_encoding(request)
+        key = make_response_key(
+            name,
+            get_version(),
+            request.query_params,
+            (request.accepted_media_type, encoding or 'identity')
+        )
+        entry = cache.get(key)
+
+        if entry is not None and not books_changed(entry.get('books')):
+            record_hit()
+            response = HttpResponse(
+                entry['content'],
+                content_type=entry['content_type']
+            )
+            self.set_encoding(response, entry['encoding'])
+            response['X-Cache'] = 'HIT'
+            # Возраст записи показывает, насколько ответ может быть устаревшим
+            response['Age'] = int(time.time() - entry['created'])
+            return response
+
+        record_miss()
+        started = time.time_ns()
+        # Реплика может еще не видеть запись, после которой сброшен кеш
+        with use_primary():
+            response = view(request, *args, **kwargs)
+
+        books = None
+        cacheable = response.status_code == status.HTTP_200_OK
+        if cacheable and track_books:
+            book_ids = getattr(self, 'page_book_ids', None)
+            books = None if book_ids is None else get_book_versions(book_ids)
+            # Книгу изменили, пока строился ответ: он мог этого не увидеть
+            cacheable = books is not None and all(
+                version < started for version in books.values()
+            )
+
+        if cacheable:
+            self.render_response(request, response)
+            content = response.content
+
+            if (encoding is None or
+                    len(content) < settings.COMPRESSION_MIN_SIZE):
+                encoding = None
+            else:
+                content = compress(
+                    content, encoding, settings.COMPRESSION_CACHE_LEVELS
+                )
+                response.content = content
+                self.set_encoding(response, encoding)
+
+            cache.set(
+                key,
+                {
+                    'content': content,
+                    'content_type': response['Content-Type'],
+                    'encoding': encoding,
+                    'books': books,
+                    'created': time.time(),
+                },
+                settings.BOOK_CACHE_TIMEOUT
+            )
+        response['X-Cache'] = 'MISS'
+
+        return response
+
+    def render_response(self, request, response):
+        # То же, что делает finalize_response и рендер после view,
+        # только раньше: в кеш попадают байты
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = self.get_renderer_context()
+
+        with timer('render'):
+            response.render()
+
+    @staticmethod
+    def set_encoding(response, encoding):
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # Без Content-Encoding ответ сожмет CompressionMiddleware
+        if encoding is not None:
+            response['Content-Encoding'] = encoding
+            response['Content-Length'] = str(len(response.content))
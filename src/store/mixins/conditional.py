@@ -0,0 +1,112 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag, urlencode
+
+from store.cache import (
+    get_book_version, get_catalogue_version, get_version_time,
+    is_cache_shared
+)
+from store.models import Book
+
+
+class ConditionalGetMixin:
+    # ETag и Last-Modified считаются без сериализации,
+    # при совпадении сразу отдаем 304
+    def list(self, request, *args, **kwargs):
+        if is_cache_shared():
+            # Версия каталога в общем кеше меняется после любой записи
+            # книг и связей, это и есть время последнего изменения
+            version = get_catalogue_version()
+            tag, last_modified = f'list:{version}', get_version_time(version)
+        else:
+            # В памяти процесса версия своя у каждого воркера и не видит
+            # записей в других, поэтому версия берется из базы: MAX по
+            # индексу updated_at, COUNT ловит удаления
+            data = self.filter_queryset(Book.objects.all()).aggregate(
+                last_modified=Max('updated_at'),
+                count=Count('pk')
+            )
+            version = self.get_relations_version(
+                request,
+                get_catalogue_version
+            )
+            tag = f"list:{data['count']}:{version}"
+            last_modified = data['last_modified']
+
+        return self.get_conditional_response(
+            request,
+            tag,
+            last_modified,
+            super().list,
+            *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        last_modified = Book.objects.filter(pk=pk).values_list(
+            'updated_at', flat=True).first()
+
+        if last_modified is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        version = self.get_relations_version(
+            request,
+            lambda: get_book_version(pk)
+        )
+
+        return self.get_conditional_response(
+            request,
+            f'detail:{pk}:{version}',
+            last_modified,
+            super().retrieve,
+            *args, **kwargs
+        )
+
+    def get_relations_version(self, request, get_version) -> str:
+        # Поля my_* меняются и без updated_at (отложенный рейтинг),
+        # версия кеша сбрасывается после любой записи связи
+        if not request.user.is_authenticated:
+            return ''
+
+        return str(get_version())
+
+    def get_etag(self, request, version: str, last_modified) -> str:
+        params = urlencode(sorted(request.query_params.lists()), doseq=True)
+        value = ':'.join([
+            version,
+            str(last_modified and last_modified.timestamp()),
+            str(request.user.pk),
+            request.accepted_media_type or '',
+            params,
+        ])
+
+        return hashlib.md5(value.encode()).hexdigest()
+
+    def get_conditional_response(self, request, version, last_modified,
+                                 view, *args, **kwargs):
+        etag = quote_etag(self.get_etag(request, version, last_modified))
+        timestamp = last_modified and int(last_modified.timestamp())
+
+        response = get_conditional_response(
+            request._request,
+            etag=etag,
+            last_modified=timestamp
+        )
+
+        if response is None:
+            response = view(request, *args, **kwargs)
+
+            if response.status_code != 200:
+                return response
+
+        # Сжатые байты отличаются от исходных, тег становится слабым
+        if response.has_header('Content-Encoding'):
+            etag = f'W/{etag}'
+
+        response['ETag'] = etag
+        if timestamp:
+            response['Last-Modified'] = http_date(timestamp)
+
+        return response
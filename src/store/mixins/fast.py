@@ -0,0 +1,44 @@
+from rest_framework.response import Response
+
+from store.mixins.book import BOOK_COLUMNS
+from store.serializers import BookFastSerializer
+
+
+class BookFastListMixin:
+    # Список строится из .values() через BookFastSerializer
+    fast_list = True
+
+    def list(self, request, *args, **kwargs):
+        if not self.fast_list:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        annotations = queryset.query.annotations
+        fields = BookFastSerializer.get_value_fields(
+            annotations,
+            self.get_serializer_context().get('fields')
+        )
+        # Поля сортировки нужны курсорной пагинации, а id - кешу страницы,
+        # даже если не выбраны
+        fields += [
+            name for name in (
+                'id',
+                'search_rank',
+                *(str(order).lstrip('-') for order in queryset.query.order_by)
+            )
+            if name not in fields and (
+                name in annotations or name in BOOK_COLUMNS
+            )
+        ]
+        rows = queryset.values(*fields)
+
+        page = self.paginate_queryset(rows)
+        serializer = BookFastSerializer(
+            rows if page is None else page,
+            context=self.get_serializer_context()
+        )
+
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+
+        return Response(serializer.data)
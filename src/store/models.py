@@ -1,7 +1,11 @@
 from copy import copy
+from decimal import Decimal, ROUND_HALF_EVEN
 from typing import TypeVar
 
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+
+from .cache import invalidate_book
 from django.contrib.auth import get_user_model
 
 
@@ -33,10 +37,152 @@ class Book(models.Model):
         null=True,
         default=None
     )
+    # Цена со скидкой, пересчитывается в save() при изменении price/discount.
+    # На Postgres ее ставит и триггер, в том числе при update() и bulk_*,
+    # на других базах update() цены или скидки должен передать end_price
+    end_price = models.DecimalField(
+        max_digits=7,
+        decimal_places=2,
+        default=0,
+        editable=False
+    )
+    # Денормализованные счетчики, их поддерживает триггер на
+    # store_userbookrelation (миграции 0021 и 0022)
+    count_likes = models.IntegerField(default=0)
+    count_bookmarks = models.IntegerField(default=0)
+    count_readers = models.IntegerField(default=0)
+    # Сумма и количество оценок, из них тот же триггер считает rating
+    rating_sum = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+    # Меняется и при изменении связей с пользователями, нужно для ETag
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Заполняется триггером Postgres по name и author
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Колонки, которые меняет только триггер на store_userbookrelation
+    TRIGGER_FIELDS = (
+        'count_likes', 'count_bookmarks', 'count_readers',
+        'rating_sum', 'rating_count', 'rating',
+    )
+
+    class Meta:
+        indexes = [
+            # Для курсорной пагинации при сортировке по цене
+            models.Index(fields=['price', 'id'], name='store_book_price_id_idx'),
+            models.Index(
+                fields=['end_price', 'id'],
+                name='store_book_end_price_id_idx'
+            ),
+            # Для фильтров BookFilter
+            models.Index(
+                fields=['rating', 'id'],
+                name='store_book_rating_id_idx'
+            ),
+            models.Index(
+                fields=['discount', 'id'],
+                name='store_book_discount_id_idx'
+            ),
+            models.Index(
+                fields=['author', 'id'],
+                name='store_book_author_id_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'id {self.pk} : {self.name}'
 
+    def get_end_price(self) -> Decimal:
+        price = self._meta.get_field('price').to_python(self.price)
+        discount = self._meta.get_field('discount').to_python(self.discount)
+
+        # Банковское округление, как у DecimalField сериализатора, который
+        # раньше округлял вычисляемую цену; так же округляет триггер
+        if discount and discount > 0:
+            return (price * (1 - discount)).quantize(
+                Decimal('0.01'),
+                rounding=ROUND_HALF_EVEN
+            )
+
+        return price
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+
+        if update_fields is None and not (
+            self._state.adding or kwargs.get('force_insert')
+        ):
+            # Полный save() существующей книги не пишет колонки триггера:
+            # иначе прочитанные ранее значения затрут изменения параллельных
+            # транзакций. Отложенные поля Django тоже не сохраняет
+            update_fields = {
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key
+            } - self.get_deferred_fields() - set(self.TRIGGER_FIELDS)
+            kwargs['update_fields'] = update_fields
+
+        if update_fields is None:
+            self.end_price = self.get_end_price()
+        elif {'price', 'discount'} & set(update_fields):
+            self.end_price = self.get_end_price()
+            kwargs['update_fields'] = {*update_fields, 'end_price'}
+
+        super().save(*args, **kwargs)
+
+
+class UserBookRelationManager(models.Manager):
+    STATE_FIELDS = ('id', 'book_id', 'like', 'is_bookmark', 'rate')
+
+    def upsert(self, user_id: int, book_id: int, **values):
+        # INSERT ... ON CONFLICT (user, book) DO UPDATE, счетчики и рейтинг
+        # книги меняет триггер в том же операторе. Прежнее состояние
+        # связи нужно только для ответа и сброса кеша, поэтому читается без
+        # блокировок одним SELECT вместе с проверкой, что книга есть
+        loaded = Book.objects.filter(pk=book_id).annotate(
+            relation=models.FilteredRelation(
+                'userbookrelation',
+                condition=models.Q(userbookrelation__user_id=user_id)
+            )
+        ).values(*(
+            f'relation__{name}' for name in self.STATE_FIELDS
+        )).first()
+        if loaded is None:
+            raise Book.DoesNotExist()
+
+        loaded = {
+            name: loaded[f'relation__{name}'] for name in self.STATE_FIELDS
+        }
+        creating = loaded['id'] is None
+        if creating:
+            loaded = None
+
+        relation = self.model(**{
+            **(loaded or {}),
+            **values,
+            'user_id': user_id,
+            'book_id': book_id,
+        })
+
+        if creating or values:
+            # Django 4.1 подставляет unique_fields в ON CONFLICT как есть,
+            # поэтому указываем имена колонок
+            conflict = {
+                'update_conflicts': True,
+                'unique_fields': ['user_id', 'book_id'],
+                'update_fields': list(values),
+            } if values else {'ignore_conflicts': True}
+
+            self.bulk_create([relation], **conflict)
+            relation.track_changes(creating, loaded)
+
+            transaction.on_commit(
+                lambda: invalidate_book(book_id, 'rate' in values)
+            )
+
+        relation._state.adding = False
+        relation._state.db = self.db
+
+        return relation, creating
+
 
 class UserBookRelation(models.Model):
     RATING = (
@@ -62,30 +208,102 @@ class UserBookRelation(models.Model):
     like = models.BooleanField(default=False)
     is_bookmark = models.BooleanField(default=False)
 
+    objects = UserBookRelationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'book'],
+                name='store_unique_user_book'
+            ),
+        ]
+        indexes = [
+            # Первые читатели книги, ROW_NUMBER() по book_id в порядке id
+            models.Index(
+                fields=['book', 'id'],
+                name='store_relation_book_id_idx'
+            ),
+            # Для фильтров админки при сортировке по id
+            models.Index(
+                fields=['rate', 'id'],
+                name='store_relation_rate_id_idx'
+            ),
+            models.Index(
+                fields=['id'],
+                condition=models.Q(like=True),
+                name='store_relation_like_idx'
+            ),
+            models.Index(
+                fields=['id'],
+                condition=models.Q(is_bookmark=True),
+                name='store_relation_bookmark_idx'
+            ),
+        ]
+
     def __str__(self):
         return f'{self.user.username} - {self.book.name} - RATE: {self.rate}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Значения из БД нужны, чтобы понять, изменилась ли оценка
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def save(self, *args, **kwargs):
         creating = not self.pk
+        loaded = None if creating else getattr(self, '_loaded_values', None)
+
+        # Счетчики и рейтинг книги меняет триггер на store_userbookrelation
         super().save(*args, **kwargs)
-        # Чтобы rating пересчитывался, только когда он изменяется
-        self._monitor_update_rate(self.rate)
-
-        # Второе условие для обновления рейтинга при создании экземпляра модели
-        if self.update_rate or creating:
-            from .utils import set_rating
-            # При обновлении экземпляра, пересчитываем рейтинг книги
-            set_rating(self.book)
-            self.set_rating_done = True
-        else:
-            self.set_rating_done = False
+        self.track_changes(creating, loaded)
+
+    def track_changes(self, creating: bool, loaded: dict | None) -> None:
+        # По update_rate сбрасываются страницы списка: их состав и порядок
+        # зависят только от рейтинга. Сам рейтинг уже пересчитал триггер
+        self._monitor_update_rate(creating, loaded)
+        self.set_rating_done = self.update_rate
 
-    def _monitor_update_rate(self, rate: None | models.SmallIntegerField) -> None:
-        self.update_rate = False
+        self._loaded_values = {
+            'book_id': self.book_id,
+            'like': self.like,
+            'is_bookmark': self.is_bookmark,
+            'rate': self.rate,
+        }
 
-        if not hasattr(self, '_rate'):
-            self._rate = None
-        if self._rate != rate and rate is not None:
-            self._rate = rate
+    def _monitor_update_rate(self, creating: bool, loaded: dict | None) -> None:
+        if creating:
+            self.update_rate = self.rate is not None
+        elif loaded is None:
+            # Прежнее значение неизвестно - считаем, что оценка изменилась
             self.update_rate = True
+        else:
+            old_rate = loaded.get('rate', self.rate)
+            old_book_id = loaded.get('book_id', self.book_id)
+            self.update_rate = old_rate != self.rate or (
+                old_book_id != self.book_id and self.rate is not None
+            )
+
+
+class BookRatingTask(models.Model):
+    # Одна запись на книгу - повторные изменения оценок схлопываются
+    book = models.OneToOneField(
+        Book,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='rating_task'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
+    def __str__(self):
+        return f'rating task: {self.book_id}'
+
+
+class Metric(models.Model):
+    # Счетчики метрик, общие для всех процессов. Приращения копит и пишет
+    # store.metrics
+    name = models.CharField(max_length=255, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
@@ -0,0 +1,82 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+# Для таблиц меньше этого числа строк оценка неточна, считаем COUNT(*)
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+class BookOffsetPagination(LimitOffsetPagination):
+    default_limit = 20
+    max_limit = 100
+
+
+class BookCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = 'id'
+    # Смещение доступно только персоналу, например для админки
+    offset_pagination_class = BookOffsetPagination
+
+    def use_offset(self, request) -> bool:
+        return bool(
+            request.user and request.user.is_staff and
+            'offset' in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_offset(request):
+            self.offset_paginator = self.offset_pagination_class()
+            return self.offset_paginator.paginate_queryset(
+                queryset, request, view)
+
+        self.offset_paginator = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.offset_paginator is not None:
+            return self.offset_paginator.get_paginated_response(data)
+
+        return super().get_paginated_response(data)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        field = ordering[0]
+
+        # Курсор хранит позицию по первому полю, id делает порядок
+        # однозначным и совпадает с составными индексами (поле, id)
+        if field.lstrip('-') != 'id':
+            ordering = (field, '-id' if field.startswith('-') else 'id')
+
+        return ordering
+
+
+class ReaderCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = 'id'
+
+
+class EstimatedCountPaginator(Paginator):
+    # Страницы админки: для списка без фильтров на Postgres число строк
+    # берется из статистики планировщика вместо полного прохода COUNT(*)
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                    [connection.ops.quote_name(queryset.model._meta.db_table)]
+                )
+                row = cursor.fetchone()
+
+            if row and row[0] >= ESTIMATED_COUNT_THRESHOLD:
+                return int(row[0])
+
+        return super().count
@@ -6,5 +6,9 @@ class IsOwnerOrStaffOrReadOnly(BasePermission):
     def has_object_permission(self, request, view, obj):
         return bool(
             request.method in SAFE_METHODS or
-            (request.user == obj.owner or request.user.is_staff)
+            # owner_id, чтобы не загружать владельца отдельным запросом.
+            # У анонима pk None, как и owner_id книги удаленного владельца
+            (request.user.is_authenticated and (
+                obj.owner_id == request.user.pk or request.user.is_staff
+            ))
         )
@@ -0,0 +1,219 @@
+import cProfile
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .metrics import metrics
+
+# Границы корзин гистограмм: время в секундах и число запросов к базе
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERIES_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+METRICS = {
+    'total': SECONDS_BUCKETS,
+    'db': SECONDS_BUCKETS,
+    'serialize': SECONDS_BUCKETS,
+    'render': SECONDS_BUCKETS,
+    'queries': QUERIES_BUCKETS,
+}
+
+PREFIX = 'profile:'
+BUCKET_KEY = PREFIX + '{view}:{metric}:{bucket}'
+SUM_KEY = PREFIX + '{view}:{metric}:sum'
+# Счетчики store.Metric целые, суммы храним в миллионных долях
+SUM_SCALE = 1_000_000
+
+_profile = ContextVar('profile', default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = 0
+        self.timings = dict.fromkeys(('db', 'serialize', 'render'), 0.0)
+        self._active = set()
+
+    def add(self, name: str, seconds: float) -> None:
+        self.timings[name] += seconds
+
+    def server_timing(self, total: float) -> str:
+        values = [
+            f'db;desc="{self.queries} queries";'
+            f'dur={self.timings["db"] * 1000:.1f}',
+            f'serialize;dur={self.timings["serialize"] * 1000:.1f}',
+            f'render;dur={self.timings["render"] * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ]
+
+        return ', '.join(values)
+
+
+def begin_profile() -> RequestProfile:
+    profile = RequestProfile()
+    _profile.set(profile)
+
+    return profile
+
+
+def end_profile() -> None:
+    # Под ASGI начало и конец запроса идут в разных контекстах,
+    # поэтому значение сбрасывается, а не восстанавливается по токену
+    _profile.set(None)
+
+
+@contextmanager
+def timer(name: str):
+    profile = _profile.get()
+
+    # Вложенные замеры (сериализатор внутри сериализатора) не суммируем
+    if profile is None or name in profile._active:
+        yield
+        return
+
+    profile._active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - start)
+        profile._active.discard(name)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    profile = _profile.get()
+
+    if profile is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries += 1
+        profile.add('db', time.perf_counter() - start)
+
+
+def install_wrapper(connection, **kwargs) -> None:
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+def install_wrappers() -> None:
+    # Новые соединения - по сигналу, уже открытые - напрямую. Под ASGI
+    # у каждого запроса свои соединения, поэтому вызывается на запрос
+    connection_created.connect(install_wrapper)
+
+    for connection in connections.all(initialized_only=True):
+        install_wrapper(connection)
+
+
+def get_view_name(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+
+    if match is None:
+        return 'unresolved'
+
+    func = match.func
+    cls = getattr(func, 'cls', None)
+
+    if cls is None:
+        return f'{func.__module__}.{func.__name__}'
+
+    # Для ViewSet - действие, для APIView - метод
+    actions = getattr(func, 'actions', None) or {}
+    method = request.method.lower()
+
+    return f'{cls.__name__}.{actions.get(method, method)}'
+
+
+def observe(view: str, profile: RequestProfile, total: float) -> None:
+    values = {
+        **profile.timings,
+        'total': total,
+        'queries': profile.queries,
+    }
+    increments = {}
+
+    for metric, buckets in METRICS.items():
+        value = values[metric]
+        bucket = next(
+            (str(bound) for bound in buckets if value <= bound),
+            '+Inf'
+        )
+        increments[BUCKET_KEY.format(
+            view=view, metric=metric, bucket=bucket)] = 1
+        increments[SUM_KEY.format(
+            view=view, metric=metric)] = round(value * SUM_SCALE)
+
+    metrics.add_many(increments)
+
+
+def get_histograms() -> dict:
+    values = metrics.read(PREFIX)
+    views = {
+        name[len(PREFIX):].rsplit(':', 2)[0] for name in values
+    }
+    result = {}
+
+    for view in sorted(views):
+        result[view] = {}
+
+        for metric, buckets in METRICS.items():
+            counts = [
+                values.get(BUCKET_KEY.format(
+                    view=view, metric=metric, bucket=bucket), 0)
+                for bucket in (*map(str, buckets), '+Inf')
+            ]
+            result[view][metric] = {
+                'buckets': list(zip((*buckets, '+Inf'), counts)),
+                'count': sum(counts),
+                'sum': values.get(
+                    SUM_KEY.format(view=view, metric=metric), 0
+                ) / SUM_SCALE,
+            }
+
+    return result
+
+
+def render_prometheus(data: dict) -> str:
+    lines = []
+
+    for metric in METRICS:
+        name = f'store_request_{metric}'
+        if metric != 'queries':
+            name += '_seconds'
+        lines.append(f'# TYPE {name} histogram')
+
+        for view, metrics in data.items():
+            cumulative = 0
+            for bound, count in metrics[metric]['buckets']:
+                cumulative += count
+                lines.append(
+                    f'{name}_bucket{{view="{view}",le="{bound}"}} '
+                    f'{cumulative}'
+                )
+            lines.append(
+                f'{name}_sum{{view="{view}"}} {metrics[metric]["sum"]}'
+            )
+            lines.append(
+                f'{name}_count{{view="{view}"}} {metrics[metric]["count"]}'
+            )
+
+    return '\n'.join(lines) + '\n'
+
+
+def reset_histograms() -> None:
+    metrics.reset(PREFIX)
+
+
+def save_profile(profiler: cProfile.Profile, view: str) -> Path:
+    directory = Path(settings.PROFILING_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    path = directory / f'{view}-{time.time_ns()}.prof'
+    profiler.dump_stats(path)
+
+    return path
@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_encoder = JSONEncoder()
+
+
+def encode_default(obj):
+    # Decimal отдаем строкой без потери точности, как DecimalField
+    # с COERCE_DECIMAL_TO_STRING. Остальное - как стандартный JSONEncoder
+    if isinstance(obj, Decimal):
+        return str(obj)
+
+    return _encoder.default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    # Быстрый вывод через orjson, байты совпадают с JSONRenderer
+    # для компактного UTF-8 без отступов. NaN и Infinity orjson
+    # выводит как null, а не падает, как JSONRenderer со STRICT_JSON
+    options = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+
+        if orjson is None or indent or not self.compact or self.ensure_ascii:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+
+        ret = orjson.dumps(data, default=encode_default, option=self.options)
+
+        # Как в JSONRenderer: U+2028 и U+2029 недопустимы в JavaScript
+        return ret.replace(
+            '\u2028'.encode(), b'\\u2028'
+        ).replace(
+            '\u2029'.encode(), b'\\u2029'
+        )
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        return msgpack.packb(data, default=encode_default)
+
+
+# Рендерер для мест, которые сериализуют JSON сами, без DRF Response
+FastJSONRenderer = ORJSONRenderer if orjson is not None else JSONRenderer
@@ -0,0 +1,86 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.conf import settings
+
+PRIMARY_DB = 'default'
+
+
+@dataclass
+class RequestState:
+    # Реплика, выбранная на весь запрос, None - читаем с основной базы
+    replica: str | None = None
+    # Запрос что-то записал, дальше читаем только с основной базы
+    wrote: bool = False
+
+
+# Вне запроса (команды, shell) состояния нет и все идет в основную базу
+_request_state: ContextVar[RequestState | None] = ContextVar(
+    'request_state', default=None
+)
+
+
+def begin_request(use_replica: bool):
+    replicas = settings.REPLICA_DATABASES
+    state = RequestState(
+        replica=random.choice(replicas) if use_replica and replicas else None
+    )
+
+    return _request_state.set(state)
+
+
+def end_request(token) -> bool:
+    state = _request_state.get()
+    _request_state.reset(token)
+
+    return bool(state and state.wrote)
+
+
+@contextmanager
+def use_primary():
+    # Чтение внутри блока идет с основной базы, например для заполнения
+    # кеша, который не должен получить отстающие данные реплики
+    state = _request_state.get()
+    if state is None:
+        yield
+        return
+
+    replica, state.replica = state.replica, None
+    try:
+        yield
+    finally:
+        state.replica = replica
+
+
+class ReplicaRouter:
+    # Безопасные запросы читают модели из REPLICA_MODELS с реплики,
+    # после первой записи запрос закрепляется за основной базой
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+
+        if state is None or state.wrote or state.replica is None:
+            return PRIMARY_DB
+
+        if model._meta.label_lower in settings.REPLICA_MODELS:
+            return state.replica
+
+        return PRIMARY_DB
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+
+        # Объект состояния общий для потоков sync_to_async
+        if state is not None:
+            state.wrote = True
+
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY_DB, *settings.REPLICA_DATABASES}
+
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+
+        return None
@@ -1,18 +1,50 @@
 from django.contrib.auth import get_user_model
+from django.db import models
 from rest_framework import serializers
 
+from .mixins.book import (
+    USER_RELATION_FIELDS, attach_reader_preview, get_reader_preview_queryset
+)
 from .models import Book, UserBookRelation
+from .profiling import timer
 
 
-class BookReadersSerializer(serializers.ModelSerializer):
+class TimedDataMixin:
+    # Время сериализации попадает в профиль запроса
+    @property
+    def data(self):
+        with timer('serialize'):
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    pass
+
+
+class BookListSerializer(TimedListSerializer):
+    # Читатели всех книг списка - одним запросом
+    def to_representation(self, data):
+        books = list(data.all() if isinstance(data, models.Manager) else data)
+
+        if 'reader' in self.child.fields:
+            attach_reader_preview([
+                book for book in books if not hasattr(book, 'reader_preview')
+            ])
+
+        return super().to_representation(books)
+
+
+class BookReadersSerializer(TimedDataMixin, serializers.ModelSerializer):
     class Meta:
+        list_serializer_class = TimedListSerializer
         model = get_user_model()
         fields = ['id', 'username']
 
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(TimedDataMixin, serializers.ModelSerializer):
     count_likes = serializers.IntegerField(read_only=True)
     count_bookmarks = serializers.IntegerField(read_only=True)
+    count_readers = serializers.IntegerField(read_only=True)
     end_price = serializers.DecimalField(
         read_only=True,
         max_digits=7,
@@ -22,10 +54,15 @@ class BookSerializer(serializers.ModelSerializer):
         read_only=True,
         default=None
     )
-    # На поле reader - вешаем сериализатор
-    reader = BookReadersSerializer(many=True, read_only=True)
+    # Связь текущего пользователя, у анонима и без аннотации - null
+    my_like = serializers.BooleanField(read_only=True, default=None)
+    my_bookmark = serializers.BooleanField(read_only=True, default=None)
+    my_rate = serializers.IntegerField(read_only=True, default=None)
+    # Только первые читатели, полный список - /api/book/{id}/readers/
+    reader = serializers.SerializerMethodField()
 
     class Meta:
+        list_serializer_class = BookListSerializer
         model = Book
         fields = [
             'id',
@@ -35,14 +72,125 @@ class BookSerializer(serializers.ModelSerializer):
             'count_likes',
             'rating',
             'count_bookmarks',
+            'count_readers',
             'owner_name',
             'reader',
             'discount',
             'end_price',
+            'my_like',
+            'my_bookmark',
+            'my_rate',
+        ]
+
+    def get_fields(self):
+        # Выбор полей из контекста (?fields=, ?omit=), только для чтения
+        fields = super().get_fields()
+        selected = self.context.get('fields')
+
+        if selected is None:
+            return fields
+
+        return {
+            name: field for name, field in fields.items()
+            if name in selected
+        }
+
+    def get_reader(self, book):
+        relations = getattr(book, 'reader_preview', None)
+
+        if relations is None:
+            relations = get_reader_preview_queryset([book.pk])
+
+        return BookReadersSerializer(
+            [relation.user for relation in relations],
+            many=True
+        ).data
+
+
+class BookFastSerializer:
+    # Только чтение: словари из строк .values() без обхода полей DRF,
+    # читатели для всей страницы - одним запросом.
+    # Вывод совпадает с BookSerializer байт в байт
+    serializer_class = BookSerializer
+
+    def __init__(self, rows, context: dict | None = None):
+        self.rows = list(rows)
+        self.context = context or {}
+
+    def get_fields(self) -> list:
+        fields = self.serializer_class(context=self.context).fields
+
+        return [
+            (name, field.to_representation)
+            for name, field in fields.items()
+        ]
+
+    @classmethod
+    def get_value_fields(cls, annotations=(), fields=None) -> list:
+        # Поля my_* есть в строках, только если queryset их аннотирует
+        return [
+            name for name in cls.serializer_class.Meta.fields
+            if name != 'reader' and (fields is None or name in fields) and (
+                name not in USER_RELATION_FIELDS or name in annotations
+            )
         ]
 
+    @staticmethod
+    def get_readers(book_ids: list) -> dict:
+        readers = {}
+        relations = get_reader_preview_queryset(book_ids).values_list(
+            'book_id', 'user__id', 'user__username'
+        )
+
+        for book_id, user_id, username in relations:
+            readers.setdefault(book_id, []).append(
+                {'id': user_id, 'username': username}
+            )
+
+        return readers
+
+    @property
+    def data(self) -> list:
+        with timer('serialize'):
+            return self.serialize()
+
+    def serialize(self) -> list:
+        fields = self.get_fields()
+        readers = {}
+
+        if any(name == 'reader' for name, _ in fields):
+            readers = self.get_readers([row['id'] for row in self.rows])
+
+        result = []
+        for row in self.rows:
+            item = {}
+
+            for name, to_representation in fields:
+                if name == 'reader':
+                    item[name] = readers.get(row['id'], [])
+                else:
+                    value = row.get(name)
+                    item[name] = (
+                        None if value is None else to_representation(value)
+                    )
+
+            result.append(item)
+
+        return result
+
+
+class UserBookRelationSerializer(TimedDataMixin,
+                                 serializers.ModelSerializer):
+    class Meta:
+        list_serializer_class = TimedListSerializer
+        model = UserBookRelation
+        fields = ['book', 'rate', 'like', 'is_bookmark']
+
+
+class UserBookRelationBulkSerializer(serializers.ModelSerializer):
+    # Существование книг проверяется одним запросом на весь пакет
+    book = serializers.IntegerField(min_value=1)
 
-class UserBookRelationSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserBookRelation
         fields = ['book', 'rate', 'like', 'is_bookmark']
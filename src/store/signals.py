@@ -0,0 +1,36 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_book
+from .models import Book, UserBookRelation
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidate_book(pk))
+
+
+@receiver(post_save, sender=UserBookRelation)
+@receiver(post_delete, sender=UserBookRelation)
+def relation_changed(sender, instance, **kwargs):
+    # После коммита счетчики и рейтинг книги уже обновлены. Состав и
+    # порядок страниц списка может поменять только рейтинг
+    book_id = instance.book_id
+
+    # При удалении книги каскадом ее кеш сбросит book_changed, по одному
+    # разу на книгу, а не на каждого читателя
+    origin = kwargs.get('origin')
+    if isinstance(origin, Book) or getattr(origin, 'model', None) is Book:
+        return
+
+    if kwargs['signal'] is post_delete:
+        lists = instance.rate is not None
+        transaction.on_commit(lambda: invalidate_book(book_id, lists))
+    else:
+        # update_rate выставляет save() уже после post_save
+        transaction.on_commit(lambda: invalidate_book(
+            book_id, getattr(instance, 'update_rate', True)
+        ))
@@ -0,0 +1,68 @@
+import random
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+
+from ..models import Book, UserBookRelation
+
+
+def seed_catalogue(
+        books: int,
+        users: int,
+        relations: int,
+        seed: int = 0,
+        batch_size: int = 1000
+) -> None:
+    # Быстрое наполнение через bulk_create, счетчики и рейтинг книг ведет
+    # триггер на store_userbookrelation
+    rnd = random.Random(seed)
+
+    get_user_model().objects.bulk_create(
+        [
+            get_user_model()(username=f'bench_user_{i}')
+            for i in range(users)
+        ],
+        batch_size=batch_size
+    )
+    user_ids = list(
+        get_user_model().objects.filter(
+            username__startswith='bench_user_'
+        ).values_list('pk', flat=True)
+    )
+
+    catalogue = [
+        Book(
+            name=f'Book {i} {rnd.choice(["red", "green", "blue"])}',
+            author=f'Author {rnd.randrange(max(books // 10, 1))}',
+            price=Decimal(rnd.randrange(100, 100000)) / 100,
+            discount=rnd.choice([None, Decimal('0.10'), Decimal('0.25')]),
+            owner_id=rnd.choice(user_ids),
+        )
+        for i in range(books)
+    ]
+    # bulk_create не вызывает save()
+    for book in catalogue:
+        book.end_price = book.get_end_price()
+
+    Book.objects.bulk_create(catalogue, batch_size=batch_size)
+    book_ids = list(Book.objects.values_list('pk', flat=True))
+
+    pairs = set()
+    limit = min(relations, len(user_ids) * len(book_ids))
+    while len(pairs) < limit:
+        pairs.add((rnd.choice(user_ids), rnd.choice(book_ids)))
+
+    UserBookRelation.objects.bulk_create(
+        [
+            UserBookRelation(
+                user_id=user_id,
+                book_id=book_id,
+                like=rnd.random() < 0.5,
+                is_bookmark=rnd.random() < 0.2,
+                rate=rnd.choice([None, 1, 2, 3, 4, 5]),
+            )
+            for user_id, book_id in pairs
+        ],
+        batch_size=batch_size
+    )
+
@@ -0,0 +1,121 @@
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Book, UserBookRelation
+from ..pagination import EstimatedCountPaginator
+from .factories import seed_catalogue
+
+
+class StoreAdminTest(TestCase):
+    def setUp(self) -> None:
+        self.admin = get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(self.admin)
+
+    def count_queries(self, url, data=None) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data)
+
+        self.assertEqual(200, response.status_code)
+        return len(queries)
+
+    def test_changelist_queries_constant(self):
+        urls = (
+            reverse('admin:store_book_changelist'),
+            reverse('admin:store_userbookrelation_changelist'),
+        )
+        seed_catalogue(books=3, users=3, relations=5)
+        small = [self.count_queries(url) for url in urls]
+
+        books = Book.objects.bulk_create([
+            Book(name=f'Book {i}', price=10, author='Author', owner=self.admin)
+            for i in range(30)
+        ])
+        UserBookRelation.objects.bulk_create([
+            UserBookRelation(user=self.admin, book=book, rate=5)
+            for book in books
+        ])
+        self.assertEqual(small, [self.count_queries(url) for url in urls])
+
+    def test_filters(self):
+        seed_catalogue(books=10, users=5, relations=20)
+        url = reverse('admin:store_book_changelist')
+
+        for params in ({'rating': 'high'}, {'has_discount': '0'}):
+            response = self.client.get(url, params)
+            self.assertEqual(200, response.status_code)
+
+        response = self.client.get(
+            reverse('admin:store_userbookrelation_changelist'),
+            {'rate__exact': '5', 'like__exact': '1'}
+        )
+        self.assertEqual(
+            UserBookRelation.objects.filter(rate=5, like=True).count(),
+            response.context['cl'].result_count
+        )
+
+    def test_recompute_ratings_action(self):
+        seed_catalogue(books=5, users=5, relations=20)
+        Book.objects.update(rating=None, rating_sum=0, rating_count=0)
+        books = list(Book.objects.values_list('pk', flat=True)[:3])
+
+        response = self.client.post(
+            reverse('admin:store_book_changelist'),
+            {'action': 'recompute_ratings', ACTION_CHECKBOX_NAME: books}
+        )
+
+        self.assertEqual(302, response.status_code)
+        for book in Book.objects.all():
+            real_count = book.userbookrelation_set.filter(
+                rate__isnull=False).count()
+            expected = real_count if book.pk in books else 0
+            self.assertEqual(expected, book.rating_count)
+
+    def test_refresh_books_action(self):
+        seed_catalogue(books=5, users=5, relations=20)
+        Book.objects.update(count_readers=0)
+        relation = UserBookRelation.objects.first()
+
+        self.client.post(
+            reverse('admin:store_userbookrelation_changelist'),
+            {'action': 'refresh_books', ACTION_CHECKBOX_NAME: [relation.pk]}
+        )
+
+        book = Book.objects.get(pk=relation.book_id)
+        self.assertEqual(
+            book.userbookrelation_set.count(), book.count_readers
+        )
+        self.assertEqual(
+            0, Book.objects.exclude(pk=book.pk).filter(
+                count_readers__gt=0).count()
+        )
+
+    def test_autocomplete(self):
+        book = Book.objects.create(name='Python', price=10, author='Author 1')
+        Book.objects.create(name='Django', price=10, author='Author 2')
+
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'store',
+            'model_name': 'userbookrelation',
+            'field_name': 'book',
+            'term': 'pyth',
+        })
+
+        self.assertEqual(
+            [str(book.pk)],
+            [item['id'] for item in response.json()['results']]
+        )
+
+    def test_paginator_exact_count_when_filtered(self):
+        seed_catalogue(books=5, users=2, relations=2)
+        paginator = EstimatedCountPaginator(
+            Book.objects.filter(price__gte=0).order_by('pk'), 2
+        )
+
+        self.assertEqual(5, paginator.count)
+        self.assertEqual(3, paginator.num_pages)
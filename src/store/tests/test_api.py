@@ -1,12 +1,27 @@
-from django.db import connection
+import datetime
+import gzip
+import json
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
 from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
 
-from ..mixins.book import BookMixin
+from ..cache import HITS_KEY, get_stats, reset_stats
+from ..metrics import MetricBuffer
+from ..mixins.book import BookMixin, READERS_PREVIEW_SIZE
 from ..models import Book, UserBookRelation
+from ..routers import use_primary
 from ..serializers import BookSerializer
 
 
@@ -48,7 +63,7 @@ class BookAPITest(APITestCase, BookMixin):
             rate=4
         )
 
-        self.books = self.get_books_queryset()
+        self.books = self.get_books_queryset(self.user)
 
         # Для проверки, что все поля, определенные в сериализаторе, выдаются
         self.serializer_fields = {
@@ -56,12 +71,13 @@ class BookAPITest(APITestCase, BookMixin):
         }
 
     def start_test(self, response, serializer_data, http_status):
+        results = response.data['results']
         response_field_names = {
-            item[0] for item in response.data[0]
+            item[0] for item in results[0]
         }
 
         self.assertEqual(http_status, response.status_code)
-        self.assertEqual(response.data, serializer_data)
+        self.assertEqual(results, serializer_data)
         self.assertEqual(
             self.serializer_fields,
             response_field_names
@@ -83,8 +99,90 @@ class BookAPITest(APITestCase, BookMixin):
             status.HTTP_200_OK
         )
 
+    def test_user_relation(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+
+        self.assertEqual(
+            [(True, True, 4), (None, None, None), (None, None, None)],
+            [
+                (item['my_like'], item['my_bookmark'], item['my_rate'])
+                for item in response.data['results']
+            ]
+        )
+
+        # Связь пользователя - JOIN в том же запросе, без запросов на строку
+        Book.objects.create(name='Book 4', price=10, author='Author4')
+        with CaptureQueriesContext(connection) as more_queries:
+            self.client.get(self.url)
+        self.assertEqual(len(queries), len(more_queries))
+
+        # Анонимный запрос этот JOIN не делает
+        self.client.logout()
+        with CaptureQueriesContext(connection) as anonymous_queries:
+            response = self.client.get(self.url)
+
+        self.assertIsNone(response.data['results'][0]['my_like'])
+        self.assertFalse(any(
+            'my_relation' in query['sql'] for query in anonymous_queries
+        ))
+
+    def test_sparse_fields(self):
+        with CaptureQueriesContext(connection) as full_queries:
+            self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                self.url,
+                {'fields': 'id,name,end_price', 'ordering': 'price',
+                 'page_size': 2}
+            )
+
+        self.assertEqual(
+            [{'id': self._books[1].id, 'name': 'Book 2',
+              'end_price': '121.00'},
+             {'id': self._books[2].id, 'name': 'Book 2 Author1',
+              'end_price': '121.00'}],
+            response.data['results']
+        )
+        # Без превью читателей, владельца, связи пользователя и счетчиков
+        self.assertEqual(len(full_queries) - 1, len(queries))
+        sql = queries[-1]['sql']
+        for name in ('JOIN', 'count_likes', 'search_vector'):
+            self.assertNotIn(name, sql)
+
+        # Курсор работает по полю сортировки, которого нет в выдаче
+        response = self.client.get(response.data['next'])
+        self.assertEqual(
+            [{'id': self._books[0].id, 'name': 'Book 1',
+              'end_price': '500.00'}],
+            response.data['results']
+        )
+
+    def test_sparse_omit_and_retrieve(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                self.url,
+                {'omit': 'reader,my_like,my_bookmark,my_rate'}
+            )
+
+        self.assertNotIn('reader', response.data['results'][0])
+        self.assertIn('owner_name', response.data['results'][0])
+        self.assertFalse(any(
+            'store_userbookrelation' in query['sql'] for query in queries
+        ))
+
+        response = self.client.get(
+            reverse('books-detail', args=(self._books[0].pk,)),
+            {'fields': 'name,my_like'}
+        )
+        self.assertEqual({'name': 'Book 1', 'my_like': True}, response.data)
+
+        response = self.client.get(self.url, {'fields': 'id,password'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('password', str(response.data['fields']))
+
     def test_search(self):
-        books_data = self.get_books_queryset().filter(
+        books_data = self.get_books_queryset(self.user).filter(
             pk__in=(self._books[0].pk,
                     self._books[2].pk)
         )
@@ -104,8 +202,16 @@ class BookAPITest(APITestCase, BookMixin):
             status.HTTP_200_OK
         )
 
+    @skipUnless(connection.vendor == 'postgresql', 'full text search')
+    def test_search_prefix(self):
+        response = self.client.get(self.url, {'search': 'autho book 2'})
+        ids = {item['id'] for item in response.data['results']}
+
+        self.assertEqual({self._books[1].id, self._books[2].id}, ids)
+
     def test_ordering_id(self):
         books_ordering_on_id = self.get_books_queryset(
+            self.user
         ).order_by('-id')
 
         serializer_data = BookSerializer(
@@ -122,6 +228,7 @@ class BookAPITest(APITestCase, BookMixin):
 
     def test_ordering_price(self):
         books_ordering_on_price = self.get_books_queryset(
+            self.user
         ).order_by('price')
 
         serializer_data = BookSerializer(
@@ -140,6 +247,173 @@ class BookAPITest(APITestCase, BookMixin):
             status.HTTP_200_OK
         )
 
+    def test_end_price_filter_and_ordering(self):
+        response = self.client.get(
+            self.url,
+            {'end_price_min': 200, 'ordering': '-end_price'}
+        )
+        self.assertEqual(
+            [self._books[0].id],
+            [item['id'] for item in response.data['results']]
+        )
+
+        response = self.client.get(self.url, {'ordering': 'end_price'})
+        self.assertEqual(
+            ['121.00', '121.00', '500.00'],
+            [item['end_price'] for item in response.data['results']]
+        )
+
+    def test_filters(self):
+        ids = [book.id for book in self._books]
+        cases = [
+            ({'price_min': 121, 'price_max': 121}, [ids[1], ids[2]]),
+            ({'rating_min': 4}, [ids[0]]),
+            ({'discount_min': 0.1}, [ids[0]]),
+            ({'author': 'Author1,Author3'}, [ids[0], ids[2]]),
+            ({'owner': self.user.id}, [ids[0], ids[2]]),
+            ({'has_discount': 'false'}, [ids[1], ids[2]]),
+            ({'has_discount': 'true', 'price_max': 100}, []),
+        ]
+
+        for params, expected in cases:
+            response = self.client.get(self.url, params)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertEqual(
+                expected,
+                [item['id'] for item in response.data['results']],
+                params
+            )
+
+    def test_end_price_follows_discount(self):
+        book = self._books[1]
+        book.discount = 0.1
+        book.save()
+
+        book.refresh_from_db()
+        self.assertEqual(Decimal('108.90'), book.end_price)
+
+        book.price = 200
+        book.save(update_fields=['price'])
+
+        book.refresh_from_db()
+        self.assertEqual(Decimal('180.00'), book.end_price)
+
+    def test_end_price_rounding(self):
+        # Половина копейки - к четной, как раньше округлял сериализатор
+        book = self._books[1]
+        for price, discount, expected in (
+            ('10.30', '0.25', '7.72'),
+            ('10.50', '0.25', '7.88'),
+        ):
+            book.price, book.discount = Decimal(price), Decimal(discount)
+            book.save()
+
+            book.refresh_from_db()
+            self.assertEqual(Decimal(expected), book.end_price)
+
+    @skipUnless(connection.vendor == 'postgresql', 'end_price trigger')
+    def test_end_price_trigger(self):
+        Book.objects.filter(pk=self._books[1].pk).update(
+            price=Decimal('10.30'), discount=Decimal('0.25')
+        )
+        Book.objects.bulk_create([
+            Book(name='Bulk', author='Author', price=Decimal('10.50'),
+                 discount=Decimal('0.25'))
+        ])
+
+        self.assertEqual(
+            Decimal('7.72'),
+            Book.objects.get(pk=self._books[1].pk).end_price
+        )
+        self.assertEqual(
+            Decimal('7.88'), Book.objects.get(name='Bulk').end_price
+        )
+
+    def test_cursor_pagination(self):
+        books = self.get_books_queryset(self.user).order_by('price', 'id')
+        ids = []
+        url = self.url
+        params = {'ordering': 'price', 'page_size': 2}
+
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            ids += [item['id'] for item in response.data['results']]
+            url, params = response.data['next'], None
+
+        self.assertEqual([book.id for book in books], ids)
+
+    def test_offset_pagination_staff_only(self):
+        response = self.client.get(self.url, {'offset': 1, 'limit': 1})
+        self.assertNotIn('count', response.data)
+
+        self.user.is_staff = True
+        self.user.save()
+
+        response = self.client.get(self.url, {'offset': 1, 'limit': 1})
+        self.assertEqual(3, response.data['count'])
+        self.assertEqual(
+            self._books[1].id,
+            response.data['results'][0]['id']
+        )
+
+    def test_reader_preview_and_readers(self):
+        readers = [
+            get_user_model().objects.create(username=f'reader{i}')
+            for i in range(READERS_PREVIEW_SIZE + 2)
+        ]
+        for reader in readers:
+            UserBookRelation.objects.create(user=reader, book=self._books[1])
+
+        response = self.client.get(self.url)
+        book = response.data['results'][1]
+
+        self.assertEqual(len(readers), book['count_readers'])
+        self.assertEqual(
+            [reader.id for reader in readers[:READERS_PREVIEW_SIZE]],
+            [item['id'] for item in book['reader']]
+        )
+
+        url = reverse('books-readers', kwargs={'pk': self._books[1].pk})
+        response = self.client.get(url, {'page_size': 4})
+        ids = [item['id'] for item in response.data['results']]
+
+        response = self.client.get(response.data['next'])
+        ids += [item['id'] for item in response.data['results']]
+
+        self.assertEqual([reader.id for reader in readers], ids)
+        self.assertIsNone(response.data['next'])
+
+    def test_export_ndjson(self):
+        response = self.client.get(
+            reverse('books-export'),
+            {'export_format': 'ndjson'}
+        )
+        rows = [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).splitlines()
+        ]
+        serializer_data = BookSerializer(
+            self.books.order_by('pk'),
+            many=True
+        ).data
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(json.loads(json.dumps(serializer_data)), rows)
+
+    def test_export_csv_gzip(self):
+        response = self.client.get(
+            reverse('books-export'),
+            {'export_format': 'csv', 'gzip': '1'}
+        )
+        content = gzip.decompress(b''.join(response.streaming_content))
+        lines = content.decode().splitlines()
+
+        self.assertEqual('application/gzip', response['Content-Type'])
+        self.assertTrue(lines[0].startswith('id,name,price'))
+        self.assertEqual(4, len(lines))
+        self.assertIn('user1', lines[1])
+
     def test_create(self):
         self.assertEqual(3, Book.objects.all().count())
 
@@ -229,6 +503,85 @@ class BookAPITest(APITestCase, BookMixin):
         )
         self.assertEqual(len(self._books), Book.objects.all().count())
 
+    def test_ownerless_book_anonymous(self):
+        # Владелец удален (SET_NULL): аноним не должен пройти как владелец
+        book = Book.objects.create(name='Book', price=10, author='Author')
+        url = reverse('books-detail', kwargs={'pk': book.pk})
+        self.client.logout()
+
+        response = self.client.patch(url, {'price': 1})
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+        response = self.client.delete(url)
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+        book.refresh_from_db()
+        self.assertEqual(10, book.price)
+
+    def test_write_queries(self):
+        # Сессия и пользователь + легкая выборка книги, запись и,
+        # для update, аннотированная строка с превью читателей для ответа
+        book = self._books[0]
+        url = reverse('books-detail', kwargs={'pk': book.pk})
+        cases = [
+            ('patch', url, {'price': 300}, 6),
+            ('put', url, {'name': 'Book', 'price': 400, 'author': 'A'}, 6),
+            ('patch', reverse('books-detail', args=(self._books[1].pk,)),
+             {'price': 1}, 3),
+            ('delete', reverse('books-detail', args=(self._books[2].pk,)),
+             None, 6),
+        ]
+
+        for method, url, data, count in cases:
+            with self.assertNumQueries(count):
+                response = getattr(self.client, method)(
+                    url, data, format='json'
+                )
+            self.assertIn(response.status_code, (200, 204, 403))
+
+        book.refresh_from_db()
+        self.assertEqual(Decimal('200.00'), book.end_price)
+
+    def test_update_keeps_counters(self):
+        book = self._books[0]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                reverse('books-detail', kwargs={'pk': book.pk}),
+                {'discount': 0.2},
+                format='json'
+            )
+
+        # Счетчики не перезаписываются, ответ - из свежей строки
+        update = next(
+            query['sql'] for query in queries
+            if query['sql'].startswith('UPDATE')
+        )
+        self.assertNotIn('count_likes', update)
+        self.assertEqual(1, response.data['count_likes'])
+        self.assertEqual('800.00', response.data['end_price'])
+        self.assertEqual('user1', response.data['owner_name'])
+
+
+class BookExportCommandTest(TestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create(username='user1')
+        self.book = Book.objects.create(
+            name='Book 1',
+            price=100,
+            author='Author1',
+        )
+
+    def test_export_command(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book)
+
+        with tempfile.NamedTemporaryFile(suffix='.ndjson.gz') as output:
+            call_command('export_books', gzip=True, output=output.name)
+            rows = gzip.decompress(output.read()).splitlines()
+
+        self.assertEqual(1, len(rows))
+        self.assertEqual(1, json.loads(rows[0])['count_readers'])
+
 
 class UserBookRelationPITest(APITestCase):
     def setUp(self) -> None:
@@ -288,6 +641,175 @@ class UserBookRelationPITest(APITestCase):
             status.HTTP_400_BAD_REQUEST
         )
 
+    def test_patch_upsert(self):
+        url = reverse('relations-detail', args=(self.books[0].pk,))
+        self.client.force_login(self.users[1])
+
+        self.client.patch(url, {'like': True})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, {'rate': 4})
+
+        inserts = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('INSERT INTO "store_userbookrelation"')
+        ]
+        self.assertEqual(1, len(inserts))
+        self.assertIn('ON CONFLICT', inserts[0])
+        # Книга и прежнее состояние связи читаются одним SELECT без
+        # блокировок, книгу обновляет триггер внутри INSERT
+        self.assertEqual(
+            ['SELECT', 'INSERT'],
+            [
+                query['sql'].split()[0] for query in queries
+                if 'store_' in query['sql']
+            ]
+        )
+        self.assertEqual(
+            {'book': self.books[0].pk, 'rate': 4, 'like': True,
+             'is_bookmark': False},
+            response.data
+        )
+
+        relations = UserBookRelation.objects.filter(book=self.books[0])
+        self.assertEqual(1, relations.count())
+
+        self.books[0].refresh_from_db()
+        self.assertEqual(
+            (1, 1, 4),
+            (
+                self.books[0].count_likes,
+                self.books[0].count_readers,
+                self.books[0].rating
+            )
+        )
+
+    def test_patch_missing_book(self):
+        url = reverse('relations-detail', args=(1000,))
+        self.client.force_login(self.users[1])
+
+        response = self.client.patch(url, {'like': True})
+
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+        self.assertFalse(UserBookRelation.objects.exists())
+
+    def test_unique_relation(self):
+        UserBookRelation.objects.create(
+            user=self.users[0],
+            book=self.books[0]
+        )
+
+        with self.assertRaises(IntegrityError):
+            UserBookRelation.objects.create(
+                user=self.users[0],
+                book=self.books[0]
+            )
+
+    def test_bulk(self):
+        user = self.users[0]
+        UserBookRelation.objects.create(
+            user=user,
+            book=self.books[0],
+            rate=2
+        )
+        self.client.force_login(user)
+
+        items = [
+            {'book': self.books[0].pk, 'rate': 4, 'like': True},
+            {'book': self.books[1].pk, 'is_bookmark': True, 'rate': 5},
+            {'book': self.books[2].pk, 'rate': 10},
+            {'book': 1000, 'like': True},
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('relations-bulk'),
+                items,
+                format='json'
+            )
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(
+            ['updated', 'created', 'error', 'error'],
+            [item['status'] for item in response.data['results']]
+        )
+        self.assertIn('rate', response.data['results'][2]['errors'])
+        self.assertIn('book', response.data['results'][3]['errors'])
+
+        # Число запросов не зависит от размера пакета, только от числа
+        # разных наборов полей: здесь их два
+        self.assertEqual(8, len(queries))
+
+        self.books[0].refresh_from_db()
+        self.books[1].refresh_from_db()
+        self.assertEqual(
+            (4, 1, 1),
+            (
+                self.books[0].rating,
+                self.books[0].count_likes,
+                self.books[0].count_readers
+            )
+        )
+        self.assertEqual(
+            (5, 1),
+            (self.books[1].rating, self.books[1].count_bookmarks)
+        )
+
+    def test_bulk_updates_only_sent_fields(self):
+        user = self.users[0]
+        for book in self.books[:2]:
+            UserBookRelation.objects.create(
+                user=user,
+                book=book,
+                like=True
+            )
+        self.client.force_login(user)
+
+        items = [
+            {'book': self.books[0].pk, 'rate': 3},
+            {'book': self.books[1].pk, 'rate': 4},
+            {'book': self.books[2].pk, 'rate': 5, 'is_bookmark': True},
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('relations-bulk'),
+                items,
+                format='json'
+            )
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        inserts = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('INSERT INTO "store_userbookrelation"')
+        ]
+        self.assertEqual(2, len(inserts))
+        # like не передан, и при конфликте его прочитанное значение
+        # не должно перезаписываться
+        self.assertNotIn('"like" = EXCLUDED', inserts[0])
+        self.assertNotIn('"is_bookmark" = EXCLUDED', inserts[0])
+        self.assertIn('"rate" = EXCLUDED', inserts[0])
+        self.assertIn('"is_bookmark" = EXCLUDED', inserts[1])
+
+        self.assertEqual(
+            [(True, False, 3), (True, False, 4), (False, True, 5)],
+            list(
+                UserBookRelation.objects.filter(user=user).order_by(
+                    'book_id'
+                ).values_list('like', 'is_bookmark', 'rate')
+            )
+        )
+
+    def test_bulk_not_list(self):
+        self.client.force_login(self.users[0])
+        response = self.client.post(
+            reverse('relations-bulk'),
+            {'book': self.books[0].pk},
+            format='json'
+        )
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
     def default(
             self,
             book: Book,
@@ -313,3 +835,287 @@ class UserBookRelationPITest(APITestCase):
                 value_attr,
                 relation.values()[0][attr]
             )
+
+
+class BookCacheTest(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        # Буфер счетчиков живет в процессе и переживает откат теста
+        reset_stats()
+
+        self.user = get_user_model().objects.create(username='user1')
+        self.book = Book.objects.create(
+            name='Book 1',
+            price=100,
+            author='Author1',
+            owner=self.user
+        )
+        self.url = reverse('books-list')
+        self.detail_url = reverse('books-detail', args=(self.book.pk,))
+
+    @override_settings(METRICS_FLUSH_SECONDS=3600)
+    def test_hit_and_stats(self):
+        response = self.client.get(self.url)
+        self.assertEqual('MISS', response['X-Cache'])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+
+        self.assertEqual('HIT', response['X-Cache'])
+        self.assertIn('Age', response)
+        # Ответ берется из кеша, в базу - только за версией для ETag
+        self.assertEqual(1, len(queries))
+        self.assertEqual('Book 1', response.json()['results'][0]['name'])
+
+        response = self.client.get(self.url, {'ordering': '-price'})
+        self.assertEqual('MISS', response['X-Cache'])
+
+        self.assertEqual(
+            {'hits': 1, 'misses': 2, 'hit_ratio': 1 / 3},
+            get_stats()
+        )
+
+    def test_stats_shared_between_processes(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+
+        # Другой процесс со своим кешем в памяти и своим буфером
+        other = MetricBuffer()
+        other.add(HITS_KEY, 2)
+        other.flush()
+        cache.clear()
+
+        out = StringIO()
+        call_command('book_cache_stats', reset=True, stdout=out)
+
+        self.assertIn('hits: 3\nmisses: 1\nhit ratio: 75.00%', out.getvalue())
+        self.assertEqual(
+            {'hits': 0, 'misses': 0, 'hit_ratio': 0.0},
+            get_stats()
+        )
+
+    def test_relation_invalidates(self):
+        self.client.get(self.url)
+        self.client.get(self.detail_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            UserBookRelation.objects.create(
+                user=self.user,
+                book=self.book,
+                like=True
+            )
+
+        for url in (self.url, self.detail_url):
+            response = self.client.get(url)
+            self.assertEqual('MISS', response['X-Cache'])
+
+        self.assertEqual(1, response.data['count_likes'])
+
+    def test_book_delete_invalidates_once(self):
+        for i in range(3):
+            UserBookRelation.objects.create(
+                user=get_user_model().objects.create(username=f'reader{i}'),
+                book=self.book,
+                rate=5
+            )
+
+        pk = self.book.pk
+        # Связи удаляются каскадом, кеш книги сбрасывается один раз
+        with mock.patch('store.signals.invalidate_book') as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.book.delete()
+
+        invalidate.assert_called_once_with(pk)
+
+    def test_page_invalidated_by_its_books(self):
+        other = Book.objects.create(name='Book 2', price=200, author='Author2')
+        params = {'page_size': 1}
+        self.client.get(self.url, params)
+
+        def create_relation(book, **values):
+            with self.captureOnCommitCallbacks(execute=True):
+                UserBookRelation.objects.create(
+                    user=self.user, book=book, **values
+                )
+
+        # Лайк книги с другой страницы эту страницу не сбрасывает
+        create_relation(other, like=True)
+        self.assertEqual('HIT', self.client.get(self.url, params)['X-Cache'])
+
+        create_relation(self.book, like=True)
+        response = self.client.get(self.url, params)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual(1, response.data['results'][0]['count_likes'])
+
+        # Рейтинг может поменять состав страниц с фильтром по нему
+        self.client.get(self.url, params)
+        UserBookRelation.objects.all().delete()
+        create_relation(other, rate=5)
+        self.assertEqual('MISS', self.client.get(self.url, params)['X-Cache'])
+
+    def test_miss_reads_primary(self):
+        with mock.patch(
+                'store.mixins.cache.use_primary', wraps=use_primary
+        ) as primary:
+            self.client.get(self.url)
+            self.client.get(self.url)
+
+        self.assertEqual(1, primary.call_count)
+
+    def test_authenticated_not_cached(self):
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+
+        self.assertNotIn('X-Cache', response)
+
+
+class BookConditionalGetTest(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+        self.user = get_user_model().objects.create(username='user1')
+        self.book = Book.objects.create(
+            name='Book 1',
+            price=100,
+            author='Author1',
+            owner=self.user
+        )
+        self.url = reverse('books-list')
+        self.detail_url = reverse('books-detail', args=(self.book.pk,))
+
+    def test_not_modified(self):
+        # Для списка версия берется из общего кеша, без него - из базы,
+        # для книги - updated_at
+        for url, shared, query_count in (
+            (self.url, False, 1),
+            (self.url, True, 0),
+            (self.detail_url, False, 1),
+        ):
+            with mock.patch(
+                    'store.mixins.conditional.is_cache_shared',
+                    return_value=shared
+            ):
+                response = self.client.get(url)
+                self.assertIn('Last-Modified', response)
+
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(
+                        url,
+                        HTTP_IF_NONE_MATCH=response['ETag']
+                    )
+
+            self.assertEqual(status.HTTP_304_NOT_MODIFIED,
+                             response.status_code)
+            self.assertEqual(query_count, len(queries))
+
+    def test_list_etag_follows_database(self):
+        # Запись в другом воркере не меняет версии в памяти этого процесса
+        etag = self.client.get(self.url)['ETag']
+        Book.objects.filter(pk=self.book.pk).update(
+            name='Book 2',
+            updated_at=self.book.updated_at + datetime.timedelta(seconds=1)
+        )
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_relation_changes_etag(self):
+        for url in (self.url, self.detail_url):
+            etag = self.client.get(url)['ETag']
+
+            with self.captureOnCommitCallbacks(execute=True):
+                UserBookRelation.objects.update_or_create(
+                    user=self.user,
+                    book=self.book,
+                    defaults={'like': url == self.url}
+                )
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertNotEqual(etag, response['ETag'])
+
+    def test_user_rate_changes_etag(self):
+        self.client.force_login(self.user)
+        UserBookRelation.objects.create(user=self.user, book=self.book)
+
+        for rate, url in enumerate((self.url, self.detail_url), start=1):
+            etag = self.client.get(url)['ETag']
+
+            with self.captureOnCommitCallbacks(execute=True):
+                UserBookRelation.objects.upsert(
+                    self.user.id, self.book.id, rate=rate
+                )
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_query_params_change_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(
+            self.url,
+            {'ordering': '-price'},
+            HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+
+class AsyncBookAPITest(TestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create(username='user1')
+        self.books = [
+            Book.objects.create(
+                name=f'Book {i}',
+                price=100 + i,
+                author='Author',
+                owner=self.user
+            )
+            for i in range(3)
+        ]
+        UserBookRelation.objects.create(
+            user=self.user,
+            book=self.books[1],
+            like=True
+        )
+
+    async def test_list(self):
+        url = reverse('async-books-list')
+        response = await self.async_client.get(url, {'limit': 2})
+        data = json.loads(b''.join(await self.collect(response)))
+
+        expected = await sync_to_async(self.serialize)(self.books[:2])
+        self.assertEqual(expected, data['results'])
+
+        response = await self.async_client.get(data['next'])
+        data = json.loads(b''.join(await self.collect(response)))
+
+        self.assertEqual([self.books[2].pk],
+                         [item['id'] for item in data['results']])
+        self.assertIsNone(data['next'])
+
+    async def test_detail(self):
+        url = reverse('async-books-detail', args=(self.books[1].pk,))
+        response = await self.async_client.get(url)
+
+        expected = await sync_to_async(self.serialize)(self.books[1:2])
+        self.assertEqual(expected[0], json.loads(response.content))
+
+        url = reverse('async-books-detail', args=(1000,))
+        response = await self.async_client.get(url)
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    @staticmethod
+    async def collect(response) -> list:
+        if not response.streaming:
+            return [response.content]
+
+        return [chunk async for chunk in response.streaming_content]
+
+    @staticmethod
+    def serialize(books) -> list:
+        queryset = BookMixin.get_books_queryset().filter(
+            pk__in=[book.pk for book in books]
+        ).order_by('pk')
+
+        return json.loads(json.dumps(BookSerializer(queryset, many=True).data))
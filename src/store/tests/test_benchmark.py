@@ -0,0 +1,286 @@
+import os
+import sys
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from ..compression import compress, get_encodings
+from ..mixins.book import BookMixin
+from ..models import Book, UserBookRelation
+from ..renderers import MessagePackRenderer, ORJSONRenderer, msgpack, orjson
+from ..serializers import BookFastSerializer
+from .factories import seed_catalogue
+
+# Размер каталога задается окружением, например
+# STORE_BENCH_BOOKS=100000 python manage.py test store.tests.test_benchmark
+BENCH_BOOKS = int(os.getenv('STORE_BENCH_BOOKS', 300))
+BENCH_USERS = int(os.getenv('STORE_BENCH_USERS', 50))
+BENCH_RELATIONS = int(os.getenv('STORE_BENCH_RELATIONS', 3000))
+BENCH_REPORT = bool(os.getenv('STORE_BENCH_REPORT'))
+# Время и память зависят от машины и нагрузки, поэтому по умолчанию
+# проверяется только число запросов. Все бюджеты:
+# STORE_BENCH_TIMING=1 python manage.py test store.tests.test_benchmark
+BENCH_TIMING = bool(os.getenv('STORE_BENCH_TIMING'))
+TIMING_METRICS = ('seconds', 'memory_mb')
+
+# Бюджеты не зависят от размера каталога: рост числа запросов - это N+1,
+# рост времени и памяти при постраничной выдаче - O(n) по каталогу
+BUDGETS = {
+    'list': {'queries': 5, 'seconds': 1.0, 'memory_mb': 8},
+    'list_search': {'queries': 5, 'seconds': 1.0, 'memory_mb': 8},
+    'list_ordering': {'queries': 5, 'seconds': 1.0, 'memory_mb': 8},
+    'list_next_page': {'queries': 5, 'seconds': 1.0, 'memory_mb': 8},
+    # Без превью читателей - на запрос меньше
+    'list_sparse': {'queries': 4, 'seconds': 1.0, 'memory_mb': 8},
+    'retrieve': {'queries': 5, 'seconds': 0.5, 'memory_mb': 4},
+    'readers': {'queries': 4, 'seconds': 0.5, 'memory_mb': 4},
+    # Блокировка книги перед upsert связи
+    'relation_patch': {'queries': 4, 'seconds': 0.5, 'memory_mb': 4},
+    'book_patch': {'queries': 6, 'seconds': 0.5, 'memory_mb': 4},
+}
+
+# Фильтры BookFilter и индекс, который должен попасть в план запроса списка.
+# Для диапазонов с сортировкой по id выбор плана зависит от статистики,
+# поэтому они проверяются только на Postgres и большом каталоге
+FILTER_PLANS = {
+    'author': ({'author': 'Author 1,Author 2'}, 'store_book_author_id_idx'),
+    'owner': ({'owner': 1}, 'store_book_owner_id'),
+    'price_range': (
+        {'price_min': 900, 'ordering': 'price'},
+        'store_book_price_id_idx'
+    ),
+    'end_price_range': (
+        {'end_price_max': 5, 'ordering': 'end_price'},
+        'store_book_end_price_id_idx'
+    ),
+    'rating_range': ({'rating_min': 4.9}, 'store_book_rating_id_idx'),
+    'discount_range': ({'discount_min': 0.2}, 'store_book_discount_id_idx'),
+}
+STATS_DEPENDENT_PLANS = {'rating_range', 'discount_range'}
+
+
+class StoreBenchmarkTest(APITestCase):
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalogue(BENCH_BOOKS, BENCH_USERS, BENCH_RELATIONS)
+        cls.user = UserBookRelation.objects.select_related(
+            'user').first().user
+        cls.book = Book.objects.order_by('-count_readers').first()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+
+        if BENCH_REPORT:
+            sys.stderr.write(
+                f'\nbooks={BENCH_BOOKS} users={BENCH_USERS} '
+                f'relations={BENCH_RELATIONS}\n'
+            )
+            for name, result in sorted(cls.results.items()):
+                if 'bytes' in result:
+                    sys.stderr.write(
+                        f"{name:<24} time={result['seconds'] * 1000:.1f}ms "
+                        f"size={result['bytes'] / 1024:.1f}KB\n"
+                    )
+                    continue
+
+                if 'index' in result:
+                    sys.stderr.write(
+                        f"{name:<24} index scan={result['index']}\n"
+                    )
+                    continue
+
+                sys.stderr.write(
+                    f"{name:<24} queries={result['queries']:<3} "
+                    f"time={result['seconds'] * 1000:.1f}ms "
+                    f"peak={result['memory_mb']:.2f}MB\n"
+                )
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def measure(self, name: str, request):
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = request()
+            seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        result = {
+            'queries': len(queries),
+            'seconds': seconds,
+            'memory_mb': peak / 1024 / 1024,
+        }
+        self.results[name] = result
+        budget = BUDGETS[name]
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        for metric, limit in budget.items():
+            if metric in TIMING_METRICS and not BENCH_TIMING:
+                continue
+
+            self.assertLessEqual(
+                result[metric],
+                limit,
+                f'{name}: {metric} over budget\n' + '\n'.join(
+                    query['sql'] for query in queries
+                )
+            )
+
+        return response
+
+    def test_list(self):
+        url = reverse('books-list')
+        response = self.measure('list', lambda: self.client.get(url))
+
+        self.measure(
+            'list_next_page',
+            lambda: self.client.get(response.data['next'])
+        )
+
+    def test_list_search(self):
+        url = reverse('books-list')
+        self.measure(
+            'list_search',
+            lambda: self.client.get(url, {'search': 'green'})
+        )
+
+    def test_list_ordering(self):
+        url = reverse('books-list')
+        self.measure(
+            'list_ordering',
+            lambda: self.client.get(url, {'ordering': '-price'})
+        )
+
+    def test_list_sparse(self):
+        url = reverse('books-list')
+        self.measure(
+            'list_sparse',
+            lambda: self.client.get(url, {'fields': 'id,name,end_price'})
+        )
+
+    def test_retrieve(self):
+        url = reverse('books-detail', args=(self.book.pk,))
+        self.measure('retrieve', lambda: self.client.get(url))
+
+    def test_readers(self):
+        url = reverse('books-readers', args=(self.book.pk,))
+        self.measure('readers', lambda: self.client.get(url))
+
+    def test_filter_plans(self):
+        url = reverse('books-list')
+        check_all = (
+            connection.vendor == 'postgresql' and BENCH_BOOKS >= 10000
+        )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE store_book')
+
+        for name, (params, index) in FILTER_PLANS.items():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+            # План основного запроса списка, как его выполнила БД
+            sql = next(
+                query['sql'] for query in queries
+                if query['sql'].startswith('SELECT "store_book"."id"')
+            )
+            with connection.cursor() as cursor:
+                prefix = connection.ops.explain_query_prefix()
+                cursor.execute(f'{prefix} {sql}')
+                plan = '\n'.join(str(row) for row in cursor.fetchall())
+
+            self.results[f'plan_{name}'] = {
+                'queries': len(queries),
+                'seconds': 0,
+                'memory_mb': 0,
+                'index': index in plan,
+            }
+
+            if name not in STATS_DEPENDENT_PLANS or check_all:
+                self.assertIn(index, plan, f'{name}: {plan}')
+
+    def test_book_patch(self):
+        # Владелец самой читаемой книги правит цену
+        self.client.force_login(self.book.owner)
+        url = reverse('books-detail', args=(self.book.pk,))
+        self.measure(
+            'book_patch',
+            lambda: self.client.patch(url, {'price': 150})
+        )
+
+    def test_renderers(self):
+        # Весь каталог одним списком: время кодирования и размер ответа
+        queryset = BookMixin.get_books_queryset(self.user)
+        rows = queryset.values(*BookFastSerializer.get_value_fields(
+            queryset.query.annotations
+        ))
+        data = BookFastSerializer(rows).data
+        renderers = {'render_json': JSONRenderer()}
+        if orjson is not None:
+            renderers['render_orjson'] = ORJSONRenderer()
+        if msgpack is not None:
+            renderers['render_msgpack'] = MessagePackRenderer()
+
+        output = {}
+        for name, renderer in renderers.items():
+            seconds = []
+            for _ in range(3):
+                start = time.perf_counter()
+                output[name] = renderer.render(data)
+                seconds.append(time.perf_counter() - start)
+
+            self.results[name] = {
+                'seconds': min(seconds),
+                'bytes': len(output[name]),
+            }
+
+        if orjson is not None:
+            self.assertEqual(output['render_json'], output['render_orjson'])
+        if msgpack is not None:
+            self.assertLess(
+                len(output['render_msgpack']), len(output['render_json'])
+            )
+
+    def test_compression(self):
+        # Сжатие ответа списка: уровни на лету и для записей кеша
+        data = BookFastSerializer(BookMixin.get_books_queryset().values(
+            *BookFastSerializer.get_value_fields()
+        )).data
+        content = JSONRenderer().render(data)
+        levels = {
+            'live': settings.COMPRESSION_LEVELS,
+            'cache': settings.COMPRESSION_CACHE_LEVELS,
+        }
+
+        for encoding in get_encodings():
+            for name, level in levels.items():
+                start = time.perf_counter()
+                compressed = compress(content, encoding, level)
+                self.results[f'{encoding}_{name}'] = {
+                    'seconds': time.perf_counter() - start,
+                    'bytes': len(compressed),
+                }
+
+                self.assertLess(len(compressed), len(content))
+
+    def test_relation_patch(self):
+        url = reverse('relations-detail', args=(self.book.pk,))
+        self.measure(
+            'relation_patch',
+            lambda: self.client.patch(url, {'rate': 3, 'like': True})
+        )
@@ -0,0 +1,126 @@
+import gzip
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from .. import compression
+from ..compression import brotli, negotiate_encoding
+from .factories import seed_catalogue
+
+
+class NegotiateEncodingTest(SimpleTestCase):
+    def negotiate(self, header):
+        return negotiate_encoding(
+            RequestFactory().get('/', HTTP_ACCEPT_ENCODING=header)
+        )
+
+    def test_gzip(self):
+        with mock.patch.object(compression, 'brotli', None):
+            for header, expected in (
+                ('gzip, deflate, br', 'gzip'),
+                ('GZIP;q=0.5', 'gzip'),
+                ('*', 'gzip'),
+                ('gzip;q=0, *', None),
+                ('deflate', None),
+                ('', None),
+            ):
+                with self.subTest(header=header):
+                    self.assertEqual(expected, self.negotiate(header))
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_brotli(self):
+        for header, expected in (
+            ('gzip, deflate, br', 'br'),
+            ('gzip;q=1, br;q=0.8', 'gzip'),
+            ('br;q=0', None),
+            ('*', 'br'),
+        ):
+            with self.subTest(header=header):
+                self.assertEqual(expected, self.negotiate(header))
+
+
+@override_settings(COMPRESSION_MIN_SIZE=200)
+class CompressionMiddlewareTest(APITestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        seed_catalogue(books=20, users=3, relations=20)
+        self.user = get_user_model().objects.first()
+        self.url = reverse('books-list')
+
+    def get_list(self, **extra):
+        return self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip', **extra)
+
+    def test_cached_response_precompressed(self):
+        plain = self.client.get(self.url)
+        self.assertNotIn('Content-Encoding', plain)
+
+        with mock.patch(
+                'store.mixins.cache.compress', wraps=compression.compress
+        ) as compress, mock.patch.object(
+                compression, 'compress', wraps=compression.compress
+        ) as compress_middleware:
+            miss = self.get_list()
+            hit = self.get_list()
+
+        # Сжимается один раз, на промахе; попадание отдает байты из кеша
+        self.assertEqual(1, compress.call_count)
+        self.assertEqual(0, compress_middleware.call_count)
+        self.assertEqual(('MISS', 'HIT'), (miss['X-Cache'], hit['X-Cache']))
+        self.assertEqual(miss.content, hit.content)
+        self.assertEqual('gzip', hit['Content-Encoding'])
+        self.assertIn('Accept-Encoding', hit['Vary'])
+        self.assertEqual(plain.content, gzip.decompress(hit.content))
+        self.assertTrue(hit['ETag'].startswith('W/'))
+
+        response = self.get_list(HTTP_IF_NONE_MATCH=hit['ETag'])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+    def test_authenticated_compressed(self):
+        self.client.force_login(self.user)
+        plain = self.client.get(self.url)
+        response = self.get_list()
+
+        self.assertNotIn('X-Cache', response)
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertEqual(plain.content, gzip.decompress(response.content))
+
+    def test_min_size(self):
+        response = self.get_list(data={'fields': 'id', 'page_size': 1})
+
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_export_stream(self):
+        url = reverse('books-export')
+        plain = b''.join(self.client.get(url).streaming_content)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertTrue(response.streaming)
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertEqual(
+            plain,
+            gzip.decompress(b''.join(response.streaming_content))
+        )
+
+        # Файл .gz уже сжат и второй раз не кодируется
+        response = self.client.get(
+            url, {'gzip': '1'}, HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertNotIn('Content-Encoding', response)
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_brotli_export_stream(self):
+        url = reverse('books-export')
+        plain = b''.join(self.client.get(url).streaming_content)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='br, gzip')
+
+        self.assertEqual('br', response['Content-Encoding'])
+        self.assertEqual(
+            plain,
+            brotli.decompress(b''.join(response.streaming_content))
+        )
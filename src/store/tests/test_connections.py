@@ -0,0 +1,177 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from unittest import mock, skipUnless
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (
+    AsyncRequestFactory, RequestFactory, SimpleTestCase, TransactionTestCase,
+    override_settings
+)
+from django.urls import path
+
+from book.db.postgresql_pool.base import ConnectionPool, base
+
+# Сырые соединения, которыми пользовались запросы, по порядку
+USED_CONNECTIONS = []
+
+
+def use_connection(request):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    USED_CONNECTIONS.append(connection.connection)
+
+    return HttpResponse()
+
+
+urlpatterns = [
+    path('connection/', use_connection),
+]
+
+IS_POOLED = connection.settings_dict['ENGINE'] == 'book.db.postgresql_pool'
+
+
+def call_wsgi(url: str) -> None:
+    environ = RequestFactory().get(url).environ
+    response = WSGIHandler()(environ, lambda status, headers: None)
+    # Как WSGI-сервер: close() шлет request_finished
+    response.close()
+
+
+async def handle_asgi(url: str) -> None:
+    scope = AsyncRequestFactory().get(url).scope
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        pass
+
+    await ASGIHandler()(scope, receive, send)
+
+
+def call_asgi(url: str) -> None:
+    # Как ASGI-сервер: свой цикл событий в отдельном потоке. Из потока
+    # теста async_to_sync выполнил бы view в нем же, и соединение
+    # переиспользовалось бы, чего под сервером не бывает
+    thread = threading.Thread(target=asyncio.run, args=(handle_asgi(url),))
+    thread.start()
+    thread.join()
+
+
+@contextmanager
+def conn_max_age(value):
+    # close_at считается при подключении, поэтому переподключаемся
+    connection.close()
+    old_value = connection.settings_dict['CONN_MAX_AGE']
+    connection.settings_dict['CONN_MAX_AGE'] = value
+
+    try:
+        yield
+    finally:
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = old_value
+
+
+# Запросы проходят через настоящие обработчики с сигналами request_started
+# и request_finished, тестовый клиент соединения не закрывает
+@override_settings(ROOT_URLCONF=__name__)
+class ConnectionReuseTest(TransactionTestCase):
+    entry_points = {
+        'wsgi': call_wsgi,
+        'asgi': call_asgi,
+    }
+
+    def request_twice(self, entry_point: str):
+        USED_CONNECTIONS.clear()
+
+        for _ in range(2):
+            self.entry_points[entry_point]('/connection/')
+
+        return USED_CONNECTIONS
+
+    def test_persistent_wsgi(self):
+        with conn_max_age(60):
+            first, second = self.request_twice('wsgi')
+            self.assertIs(first, second)
+
+    def test_persistent_asgi_not_reused(self):
+        # Каждый ASGI-запрос выполняет view в новом потоке, постоянное
+        # соединение потока больше не используется. Поэтому без пула
+        # CONN_MAX_AGE по умолчанию 0
+        if IS_POOLED:
+            self.skipTest('The pool reuses connections across threads')
+
+        with conn_max_age(60):
+            first, second = self.request_twice('asgi')
+            self.assertIsNot(first, second)
+
+    @skipUnless(IS_POOLED, 'Only for the pooled backend')
+    def test_pool_without_persistence(self):
+        with conn_max_age(0):
+            for entry_point in self.entry_points:
+                first, second = self.request_twice(entry_point)
+                self.assertIs(first, second, entry_point)
+                # После запроса соединение вернулось в пул
+                self.assertIsNone(connection.connection)
+
+    @skipUnless(
+        connection.vendor == 'postgresql' and not IS_POOLED,
+        'Only for Postgres without the pool'
+    )
+    def test_no_reuse_without_persistence(self):
+        with conn_max_age(0):
+            for entry_point in self.entry_points:
+                first, second = self.request_twice(entry_point)
+                self.assertIsNot(first, second, entry_point)
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    def make_pool(self, connections, **options):
+        pool = ConnectionPool({}, **{
+            'min_size': 0, 'max_size': 2, 'timeout': 1, **options
+        })
+        pool.pool = mock.Mock()
+        pool.pool.getconn.side_effect = connections
+
+        return pool
+
+    @staticmethod
+    def make_connection(alive: bool = True):
+        connection = mock.MagicMock(closed=0)
+        cursor = connection.cursor.return_value.__enter__.return_value
+        if not alive:
+            cursor.execute.side_effect = base.Database.OperationalError(
+                'terminated'
+            )
+
+        return connection
+
+    def test_dead_connection_replaced(self):
+        dead, alive = self.make_connection(False), self.make_connection()
+        pool = self.make_pool([dead, alive])
+
+        self.assertIs(alive, pool.getconn())
+        pool.pool.putconn.assert_called_once_with(dead, close=True)
+
+    def test_no_usable_connection(self):
+        pool = self.make_pool(
+            [self.make_connection(False) for _ in range(3)]
+        )
+
+        with self.assertRaises(base.Database.OperationalError):
+            pool.getconn()
+
+        # Слот вернулся, пул не исчерпан
+        self.assertTrue(pool.slots.acquire(blocking=False))
+
+    def test_check_disabled(self):
+        closed, unchecked = self.make_connection(), self.make_connection()
+        closed.closed = 1
+        pool = self.make_pool([closed, unchecked], check=False)
+
+        self.assertIs(unchecked, pool.getconn())
+        unchecked.cursor.assert_not_called()
@@ -0,0 +1,106 @@
+import re
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from ..models import Book
+from ..metrics import MetricBuffer
+from ..profiling import BUCKET_KEY, get_histograms, reset_histograms
+
+
+@override_settings(
+    MIDDLEWARE=[
+        'store.middleware.ProfilingMiddleware',
+        *(
+            middleware for middleware in settings.MIDDLEWARE
+            if middleware != 'store.middleware.ProfilingMiddleware'
+        )
+    ],
+    PROFILING_ENABLED=True,
+    # Слив в store.Metric - только при чтении, иначе он попадет в замеры
+    METRICS_FLUSH_SECONDS=3600,
+)
+class ProfilingMiddlewareTest(TestCase):
+    def setUp(self) -> None:
+        # Буфер счетчиков живет в процессе и переживает откат теста
+        reset_histograms()
+
+        self.user = get_user_model().objects.create(username='user1')
+        self.client.force_login(self.user)
+        self.book = Book.objects.create(
+            name='Book 1',
+            price=100,
+            author='Author1'
+        )
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('books-list'))
+
+        timing = response['Server-Timing']
+        self.assertIn(f'db;desc="{len(queries)} queries"', timing)
+        for name in ('serialize', 'render', 'total'):
+            self.assertRegex(timing, rf'{name};dur=\d+\.\d')
+
+    def test_histograms_by_view(self):
+        self.client.get(reverse('books-list'))
+        self.client.patch(
+            reverse('relations-detail', args=(self.book.pk,)),
+            {'like': True},
+            content_type='application/json'
+        )
+
+        data = get_histograms()
+        self.assertEqual(1, data['BookViewSet.list']['total']['count'])
+        self.assertEqual(
+            1,
+            data['UserBookRelationView.partial_update']['queries']['count']
+        )
+        self.assertGreater(data['BookViewSet.list']['queries']['sum'], 0)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertIn(
+            'store_request_total_seconds_count{view="BookViewSet.list"} 1',
+            response.content.decode()
+        )
+
+        output = StringIO()
+        call_command('dump_metrics', reset=True, stdout=output)
+        self.assertRegex(output.getvalue(), r'BookViewSet\.list\n  total')
+        self.assertEqual({}, get_histograms())
+
+    def test_histograms_shared_between_processes(self):
+        self.client.get(reverse('books-list'))
+
+        # Другой процесс сливает свои приращения в ту же таблицу
+        other = MetricBuffer()
+        other.add(BUCKET_KEY.format(
+            view='BookViewSet.list', metric='total', bucket='+Inf'))
+        other.flush()
+
+        total = get_histograms()['BookViewSet.list']['total']
+        self.assertEqual(2, total['count'])
+        self.assertEqual(('+Inf', 1), total['buckets'][-1])
+
+    def test_slow_request_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.settings(PROFILING_SAMPLE_RATE=1,
+                               PROFILING_SLOW_SECONDS=0,
+                               PROFILING_DIR=directory):
+                with self.assertLogs('store.middleware', 'WARNING'):
+                    self.client.get(reverse('books-list'))
+
+            profiles = [path.name for path in Path(directory).iterdir()]
+
+        self.assertEqual(1, len(profiles))
+        self.assertTrue(re.match(r'BookViewSet\.list-\d+\.prof', profiles[0]))
@@ -0,0 +1,101 @@
+import datetime
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from ..mixins.book import BookMixin
+from ..models import Book
+from ..renderers import MessagePackRenderer, ORJSONRenderer, msgpack, orjson
+from ..serializers import BookSerializer
+from .factories import seed_catalogue
+
+
+@skipUnless(orjson, 'orjson is not installed')
+class ORJSONRendererTest(TestCase, BookMixin):
+    def test_same_bytes_as_json_renderer(self):
+        seed_catalogue(books=30, users=5, relations=60)
+        user = get_user_model().objects.first()
+        data = [
+            BookSerializer(
+                self.get_books_queryset(user).order_by('id'),
+                many=True
+            ).data,
+            {
+                'price': Decimal('10.50'),
+                'created': datetime.datetime(
+                    2022, 1, 2, 3, 4, 5, 6, tzinfo=datetime.timezone.utc
+                ),
+                'name': 'Книга\u2028',
+                1: None,
+            },
+        ]
+
+        for item in data:
+            expected = JSONRenderer().render(item)
+            # Decimal стандартный энкодер отдает float, мы - строку
+            if isinstance(item, dict):
+                expected = expected.replace(b'10.5', b'"10.50"')
+
+            self.assertEqual(expected, ORJSONRenderer().render(item))
+
+    def test_indent_falls_back(self):
+        self.assertEqual(
+            b'{\n  "a": 1\n}',
+            ORJSONRenderer().render(
+                {'a': 1}, 'application/json; indent=2'
+            )
+        )
+
+    def test_default_renderer(self):
+        self.assertEqual(
+            ORJSONRenderer,
+            api_settings.DEFAULT_RENDERER_CLASSES[0]
+        )
+
+
+@skipUnless(msgpack, 'msgpack is not installed')
+@override_settings(REST_FRAMEWORK={
+    'DEFAULT_RENDERER_CLASSES': [
+        'store.renderers.ORJSONRenderer',
+        'store.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'store.parsers.MessagePackParser',
+    ],
+})
+class MessagePackTest(TestCase):
+    def setUp(self) -> None:
+        seed_catalogue(books=5, users=2, relations=5)
+        self.user = get_user_model().objects.first()
+        self.client.force_login(self.user)
+
+    def test_negotiation(self):
+        response = self.client.get(
+            reverse('books-list'),
+            HTTP_ACCEPT='application/msgpack'
+        )
+
+        self.assertEqual('application/msgpack', response['Content-Type'])
+        data = msgpack.unpackb(response.content)
+        self.assertEqual(5, len(data['results']))
+        self.assertEqual(
+            MessagePackRenderer().render(response.data), response.content
+        )
+
+    def test_parser(self):
+        book = Book.objects.first()
+        response = self.client.patch(
+            reverse('relations-detail', args=(book.pk,)),
+            msgpack.packb({'like': True, 'rate': 4}),
+            content_type='application/msgpack'
+        )
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(4, response.data['rate'])
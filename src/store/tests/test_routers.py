@@ -0,0 +1,122 @@
+from unittest import skipUnless
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, override_settings
+)
+from django.urls import reverse
+from rest_framework import status
+
+from ..middleware import PIN_COOKIE, replica_pinning_middleware
+from ..models import Book
+from ..routers import (
+    PRIMARY_DB, ReplicaRouter, begin_request, end_request, use_primary
+)
+
+# Реплика с отдельной тестовой базой, а не зеркало default
+REPLICA = next(
+    (
+        alias for alias in settings.REPLICA_DATABASES
+        if not connections[alias].settings_dict['TEST'].get('MIRROR')
+    ),
+    None
+)
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self) -> None:
+        self.router = ReplicaRouter()
+
+    def route(self, method='get', write=False, cookies=None):
+        routes = {}
+
+        def view(request):
+            if write:
+                self.router.db_for_write(Book)
+            routes['book'] = self.router.db_for_read(Book)
+            routes['user'] = self.router.db_for_read(get_user_model())
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        response = replica_pinning_middleware(view)(request)
+
+        return routes, response
+
+    def test_safe_request(self):
+        routes, response = self.route()
+
+        self.assertEqual({'book': 'replica', 'user': PRIMARY_DB}, routes)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_use_primary(self):
+        token = begin_request(use_replica=True)
+        try:
+            with use_primary():
+                self.assertEqual(PRIMARY_DB, self.router.db_for_read(Book))
+            self.assertEqual('replica', self.router.db_for_read(Book))
+        finally:
+            end_request(token)
+
+    def test_unsafe_request(self):
+        routes, _ = self.route('post')
+        self.assertEqual(PRIMARY_DB, routes['book'])
+
+    def test_pin_after_write(self):
+        routes, response = self.route(write=True)
+        self.assertEqual(PRIMARY_DB, routes['book'])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        routes, _ = self.route(cookies={PIN_COOKIE: '1'})
+        self.assertEqual(PRIMARY_DB, routes['book'])
+
+    def test_outside_request(self):
+        self.assertEqual(PRIMARY_DB, self.router.db_for_read(Book))
+
+    def test_async_request(self):
+        routes = {}
+
+        async def view(request):
+            routes['book'] = self.router.db_for_read(Book)
+            return HttpResponse()
+
+        async_to_sync(replica_pinning_middleware(view))(
+            RequestFactory().get('/')
+        )
+        self.assertEqual('replica', routes['book'])
+
+
+# Две отдельные базы в REPLICA_DATABASES, например
+# DB_REPLICA_HOSTS=localhost DB_REPLICA_TEST_SEPARATE=1 (см. settings)
+@skipUnless(
+    REPLICA,
+    'No replica with its own test database, set DB_REPLICA_TEST_SEPARATE=1'
+)
+class ReplicaReadYourWritesTest(TestCase):
+    databases = {PRIMARY_DB, REPLICA} if REPLICA else {PRIMARY_DB}
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create(username='user1')
+        self.client.force_login(self.user)
+        self.url = reverse('books-list')
+
+    def test_read_your_writes(self):
+        response = self.client.post(
+            self.url,
+            {'name': 'Book 1', 'price': 100, 'author': 'Author1'}
+        )
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        # Реплика книгу еще не получила, но автор записи видит ее сразу
+        response = self.client.get(self.url)
+        self.assertEqual(1, len(response.data['results']))
+
+        self.client.cookies.pop(PIN_COOKIE)
+        response = self.client.get(self.url)
+        self.assertEqual([], response.data['results'])
@@ -1,9 +1,13 @@
 from django.contrib.auth import get_user_model as user
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
 
-from ..mixins.book import BookMixin
-from ..serializers import BookSerializer
+from ..mixins.book import BookMixin, get_reader_preview_queryset
+from ..serializers import BookFastSerializer, BookSerializer
 from ..models import Book, UserBookRelation
+from .factories import seed_catalogue
 
 
 class BookSerializerTest(TestCase, BookMixin):
@@ -72,6 +76,7 @@ class BookSerializerTest(TestCase, BookMixin):
                 'count_likes': 2,
                 'rating': '4.50',
                 'count_bookmarks': 2,
+                'count_readers': 2,
                 'owner_name': self.user_1.username,
                 'reader': [
                     {
@@ -84,7 +89,10 @@ class BookSerializerTest(TestCase, BookMixin):
                     },
                 ],
                 'discount': '0.50',
-                'end_price': '50.00'
+                'end_price': '50.00',
+                'my_like': None,
+                'my_bookmark': None,
+                'my_rate': None,
             },
             {
                 'id': self.book_2.id,
@@ -94,6 +102,7 @@ class BookSerializerTest(TestCase, BookMixin):
                 'count_likes': 0,
                 'rating': None,
                 'count_bookmarks': 0,
+                'count_readers': 1,
                 'owner_name': self.user_2.username,
                 'reader': [
                     {
@@ -103,6 +112,9 @@ class BookSerializerTest(TestCase, BookMixin):
                 ],
                 'discount': None,
                 'end_price': '112.00',
+                'my_like': None,
+                'my_bookmark': None,
+                'my_rate': None,
             },
             {
                 'id': self.book_3.id,
@@ -112,6 +124,7 @@ class BookSerializerTest(TestCase, BookMixin):
                 'count_likes': 1,
                 'rating': '3.00',
                 'count_bookmarks': 0,
+                'count_readers': 1,
                 'owner_name': self.user_3.username,
                 'reader': [
                     {
@@ -121,6 +134,9 @@ class BookSerializerTest(TestCase, BookMixin):
                 ],
                 'discount': None,
                 'end_price': '113.00',
+                'my_like': None,
+                'my_bookmark': None,
+                'my_rate': None,
             }
         ]
 
@@ -130,6 +146,63 @@ class BookSerializerTest(TestCase, BookMixin):
 
         self.assertEqual(self.srl_book_data, serializer_data)
 
+    def test_user_relation(self):
+        data = BookSerializer(
+            self.get_books_queryset(self.user_3).order_by('id'),
+            many=True
+        ).data
+
+        self.assertEqual(
+            [
+                (None, None, None),
+                (False, False, None),
+                (True, False, 3),
+            ],
+            [
+                (item['my_like'], item['my_bookmark'], item['my_rate'])
+                for item in data
+            ]
+        )
+
+    def test_fast_serializer_parity(self):
+        seed_catalogue(books=50, users=10, relations=200)
+        Book.objects.filter(pk=self.book_2.pk).update(owner=None)
+
+        queryset = self.get_books_queryset(self.user_3).order_by('id')
+        rows = queryset.prefetch_related(None).values(
+            *BookFastSerializer.get_value_fields(queryset.query.annotations)
+        )
+
+        renderer = JSONRenderer()
+        self.assertEqual(
+            renderer.render(BookSerializer(queryset, many=True).data),
+            renderer.render(BookFastSerializer(rows).data)
+        )
+
+    def test_reader_preview_per_book(self):
+        readers = user().objects.bulk_create([
+            user()(username=f'reader_{i}') for i in range(4)
+        ])
+        for book in (self.book_1, self.book_2):
+            UserBookRelation.objects.bulk_create([
+                UserBookRelation(user=reader, book=book) for reader in readers
+            ])
+        books = [self.book_1, self.book_2]
+
+        with CaptureQueriesContext(connection) as queries:
+            relations = list(get_reader_preview_queryset(books, size=2))
+
+        self.assertEqual(1, len(queries))
+        self.assertIn('ROW_NUMBER', queries[0]['sql'])
+        self.assertEqual(
+            [
+                (book.pk, relation.pk)
+                for book in books
+                for relation in book.userbookrelation_set.order_by('pk')[:2]
+            ],
+            sorted((item.book_id, item.pk) for item in relations)
+        )
+
     def test_update_book(self):
         relation = UserBookRelation.objects.create(
             user=self.user_3,
@@ -0,0 +1,350 @@
+from decimal import Decimal
+from io import StringIO
+from threading import Barrier, Thread
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model as user
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from ..models import Book, BookRatingTask, UserBookRelation
+from ..utils import get_rating, recompute_book_ratings, set_rating
+
+
+class BookCountersTest(TestCase):
+    def setUp(self) -> None:
+        self.user_1 = user().objects.create(username='user_1')
+        self.user_2 = user().objects.create(username='user_2')
+
+        self.book = Book.objects.create(
+            name='Book 1',
+            price=100,
+            author='Author1',
+        )
+
+    def assertCounters(self, likes, bookmarks, readers):
+        self.book.refresh_from_db()
+        self.assertEqual(
+            (likes, bookmarks, readers),
+            (
+                self.book.count_likes,
+                self.book.count_bookmarks,
+                self.book.count_readers,
+            )
+        )
+
+    def test_create_update_delete(self):
+        relation = UserBookRelation.objects.create(
+            user=self.user_1,
+            book=self.book,
+            like=True,
+        )
+        UserBookRelation.objects.create(
+            user=self.user_2,
+            book=self.book,
+            is_bookmark=True,
+        )
+        self.assertCounters(1, 1, 2)
+
+        relation.like = False
+        relation.is_bookmark = True
+        relation.save()
+        self.assertCounters(0, 2, 2)
+
+        # Экземпляр, загруженный из БД, тоже считает разницу
+        relation = UserBookRelation.objects.get(pk=relation.pk)
+        relation.like = True
+        relation.save()
+        self.assertCounters(1, 2, 2)
+
+        relation.delete()
+        self.assertCounters(0, 1, 1)
+
+        UserBookRelation.objects.all().delete()
+        self.assertCounters(0, 0, 0)
+
+    def test_bulk_writes(self):
+        # save() не вызывается, счетчики меняет триггер
+        UserBookRelation.objects.bulk_create([
+            UserBookRelation(user=self.user_1, book=self.book, like=True),
+            UserBookRelation(user=self.user_2, book=self.book),
+        ])
+        self.assertCounters(1, 0, 2)
+
+        UserBookRelation.objects.update(is_bookmark=True)
+        self.assertCounters(1, 2, 2)
+
+        relations = list(UserBookRelation.objects.order_by('pk'))
+        for relation in relations:
+            relation.like = not relation.like
+        UserBookRelation.objects.bulk_update(relations, ['like'])
+        self.assertCounters(1, 2, 2)
+
+        other = Book.objects.create(name='Book 2', price=10, author='Author')
+        UserBookRelation.objects.filter(user=self.user_2).update(book=other)
+        self.assertCounters(0, 1, 1)
+        other.refresh_from_db()
+        self.assertEqual(
+            (1, 1, 1),
+            (other.count_likes, other.count_bookmarks, other.count_readers)
+        )
+
+    def test_book_save_keeps_counters(self):
+        book = Book.objects.get(pk=self.book.pk)
+        UserBookRelation.objects.create(
+            user=self.user_1,
+            book=self.book,
+            like=True,
+        )
+
+        # Экземпляр со старыми счетчиками не должен их затереть
+        book.name = 'Book 1 (2nd edition)'
+        book.save()
+
+        self.assertCounters(1, 0, 1)
+        self.assertEqual('Book 1 (2nd edition)', self.book.name)
+
+    def test_rebuild_command(self):
+        UserBookRelation.objects.create(
+            user=self.user_1,
+            book=self.book,
+            like=True,
+            is_bookmark=True,
+        )
+        Book.objects.update(count_likes=10, count_readers=0)
+
+        call_command('rebuild_book_counters', batch_size=1, stdout=StringIO())
+
+        self.assertCounters(1, 1, 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs concurrent writers')
+class UpsertConcurrencyTest(TransactionTestCase):
+    def test_parallel_first_upsert(self):
+        users = [user().objects.create(username=f'user_{i}') for i in range(2)]
+        book = Book.objects.create(name='Book 1', price=100, author='Author1')
+        # Оба потока создают одну и ту же связь одновременно
+        barrier = Barrier(2)
+
+        def upsert():
+            barrier.wait()
+            try:
+                UserBookRelation.objects.upsert(
+                    users[0].pk, book.pk, like=True, rate=5
+                )
+            finally:
+                connections.close_all()
+
+        threads = [Thread(target=upsert) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        book.refresh_from_db()
+        self.assertEqual(
+            (1, 1, 5, 1),
+            (book.count_readers, book.count_likes, book.rating_sum,
+             book.rating_count)
+        )
+
+
+class BookRatingTest(TestCase):
+    def setUp(self) -> None:
+        self.users = [
+            user().objects.create(username=f'user_{i}') for i in range(3)
+        ]
+        self.book = Book.objects.create(
+            name='Book 1',
+            price=100,
+            author='Author1',
+        )
+
+    def assertRating(self, rating, rating_sum, rating_count):
+        self.book.refresh_from_db()
+        self.assertEqual(
+            (rating, rating_sum, rating_count),
+            (
+                self.book.rating,
+                self.book.rating_sum,
+                self.book.rating_count,
+            )
+        )
+
+    def test_add_change_clear(self):
+        relation = UserBookRelation.objects.create(
+            user=self.users[0],
+            book=self.book,
+            rate=5,
+        )
+        UserBookRelation.objects.create(
+            user=self.users[1],
+            book=self.book,
+            rate=4,
+        )
+        UserBookRelation.objects.create(
+            user=self.users[2],
+            book=self.book,
+        )
+        self.assertRating(Decimal('4.50'), 9, 2)
+
+        relation = UserBookRelation.objects.get(pk=relation.pk)
+        relation.rate = 1
+        relation.save()
+        self.assertRating(Decimal('2.50'), 5, 2)
+
+        relation.rate = None
+        relation.save()
+        self.assertRating(Decimal('4.00'), 4, 1)
+
+        UserBookRelation.objects.all().delete()
+        self.assertRating(None, 0, 0)
+
+    def test_rounding_boundary(self):
+        # 33 / 8 = 4.125 - ровно на границе округления. Половина - к четной,
+        # как DecimalField(3, 2) округлял Avg до хранения рейтинга
+        readers = [
+            user().objects.create(username=f'reader_{i}') for i in range(8)
+        ]
+        for rate, reader in zip((5, 5, 5, 4, 4, 4, 3, 3), readers):
+            UserBookRelation.objects.create(
+                user=reader,
+                book=self.book,
+                rate=rate,
+            )
+        # Триггер на store_userbookrelation
+        self.assertRating(Decimal('4.12'), 33, 8)
+        self.assertEqual(Decimal('4.12'), get_rating(33, 8))
+        self.assertEqual(Decimal('4.62'), get_rating(37, 8))
+        self.assertEqual(Decimal('4.38'), get_rating(35, 8))
+
+        set_rating(self.book)
+        self.assertRating(Decimal('4.12'), 33, 8)
+
+        Book.objects.update(rating=None)
+        recompute_book_ratings()
+        self.assertRating(Decimal('4.12'), 33, 8)
+
+        # 35 / 8 = 4.375 - вверх, к четной
+        relation = UserBookRelation.objects.get(user=readers[-1])
+        relation.rate = 5
+        relation.save()
+        self.assertRating(Decimal('4.38'), 35, 8)
+
+    def test_save_updates_book_in_trigger(self):
+        relation = UserBookRelation.objects.create(
+            user=self.users[0],
+            book=self.book,
+        )
+        relation.rate = 3
+
+        # Книгу обновляет триггер, из Python уходит один UPDATE связи
+        with CaptureQueriesContext(connection) as queries:
+            relation.save()
+
+        self.assertEqual(1, len(queries))
+        self.assertTrue(
+            queries[0]['sql'].startswith('UPDATE "store_userbookrelation"')
+        )
+        self.assertRating(Decimal('3.00'), 3, 1)
+
+    def test_bulk_writes(self):
+        readers = self.users[:2]
+        UserBookRelation.objects.bulk_create([
+            UserBookRelation(user=reader, book=self.book, rate=rate)
+            for rate, reader in zip((5, 2), readers)
+        ])
+        self.assertRating(Decimal('3.50'), 7, 2)
+
+        UserBookRelation.objects.filter(user=readers[0]).update(rate=None)
+        self.assertRating(Decimal('2.00'), 2, 1)
+
+        relations = list(UserBookRelation.objects.all())
+        for relation in relations:
+            relation.rate = 4
+        UserBookRelation.objects.bulk_update(relations, ['rate'])
+        self.assertRating(Decimal('4.00'), 8, 2)
+
+        # Полный save() книги не затирает рейтинг, посчитанный триггером
+        book = Book.objects.get(pk=self.book.pk)
+        UserBookRelation.objects.create(
+            user=self.users[2],
+            book=self.book,
+            rate=1,
+        )
+        book.save()
+        self.assertRating(Decimal('3.00'), 9, 3)
+
+    def test_reconcile_command(self):
+        UserBookRelation.objects.create(
+            user=self.users[0],
+            book=self.book,
+            rate=2,
+        )
+        UserBookRelation.objects.create(
+            user=self.users[1],
+            book=self.book,
+            rate=3,
+        )
+        Book.objects.update(rating_sum=100, rating_count=1, rating=None)
+
+        out = StringIO()
+        call_command('reconcile_ratings', batch_size=1, stdout=out)
+
+        self.assertIn('1', out.getvalue())
+        self.assertRating(Decimal('2.50'), 5, 2)
+
+    @override_settings(RATING_RECOMPUTE_MODE='deferred')
+    def test_deferred_queue(self):
+        for rate, reader in zip((5, 4, 3), self.users):
+            UserBookRelation.objects.create(
+                user=reader,
+                book=self.book,
+                rate=rate,
+            )
+        Book.objects.update(rating_sum=100, rating_count=1, rating=None)
+
+        # Полный пересчет откладывается, повторы схлопываются в одну задачу
+        for _ in range(3):
+            with self.captureOnCommitCallbacks(execute=True):
+                set_rating(self.book)
+
+        self.assertEqual(1, BookRatingTask.objects.count())
+        self.assertRating(None, 100, 1)
+
+        out = StringIO()
+        call_command('process_rating_queue', once=True, stdout=out)
+
+        self.assertIn('1', out.getvalue())
+        self.assertFalse(BookRatingTask.objects.exists())
+        self.assertRating(Decimal('4.00'), 12, 3)
+
+    @override_settings(RATING_RECOMPUTE_MODE='deferred')
+    def test_deferred_enqueue_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            set_rating(self.book)
+            # До коммита обработчик не должен видеть задачу
+            self.assertFalse(BookRatingTask.objects.exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertTrue(BookRatingTask.objects.exists())
+
+    @override_settings(RATING_RECOMPUTE_MODE='deferred')
+    def test_deferred_delete_book(self):
+        for rate, reader in zip((5, 4), self.users):
+            UserBookRelation.objects.create(
+                user=reader,
+                book=self.book,
+                rate=rate,
+            )
+
+        # Книгу удалили в той же транзакции, что поставила задачу
+        with self.captureOnCommitCallbacks(execute=True):
+            set_rating(self.book)
+            self.book.delete()
+
+        self.assertFalse(Book.objects.exists())
+        self.assertFalse(BookRatingTask.objects.exists())
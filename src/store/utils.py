@@ -1,13 +1,292 @@
-from django.db.models import Avg
+from decimal import ROUND_HALF_EVEN, Decimal
+from string import Formatter
 
-from store.models import UserBookRelation
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    Case, Count, DecimalField, F, Func, OuterRef, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from store.cache import invalidate_books
+from store.models import Book, BookRatingTask, UserBookRelation
+
+RATING_FIELDS = ['rating', 'rating_sum', 'rating_count', 'updated_at']
+
+
+class RatingAverage(Func):
+    # sum / count с округлением до сотых половиной к четному, как
+    # get_rating и DecimalField(3, 2) над Avg до хранения рейтинга.
+    # ROUND() в Postgres и SQLite округляет половину от нуля, поэтому
+    # сотые считаются целочисленным делением, остаток решает округление
+    template = (
+        'CAST(({sum}) * 100 / ({count}) + CASE'
+        ' WHEN 2 * (({sum}) * 100 %% ({count})) > ({count})'
+        ' OR (2 * (({sum}) * 100 %% ({count})) = ({count})'
+        ' AND ({sum}) * 100 / ({count}) %% 2 = 1)'
+        ' THEN 1 ELSE 0 END AS INTEGER) / 100.0'
+    )
+    output_field = DecimalField(max_digits=3, decimal_places=2)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        compiled = dict(zip(
+            ('sum', 'count'),
+            (compiler.compile(arg) for arg in self.get_source_expressions())
+        ))
+        sql, params = [], []
+
+        for literal, name, _, _ in Formatter().parse(self.template):
+            sql.append(literal)
+            if name:
+                sql.append(compiled[name][0])
+                params.extend(compiled[name][1])
+
+        return ''.join(sql), params
+
+
+def get_rating(rating_sum: int, rating_count: int) -> Decimal | None:
+    if not rating_count:
+        return None
+
+    return (Decimal(rating_sum) / rating_count).quantize(
+        Decimal('0.01'),
+        rounding=ROUND_HALF_EVEN
+    )
+
+
+def get_rating_expression(rating_sum, rating_count) -> Case:
+    # Один и тот же расчет для инкрементального пути и полного пересчета
+    return Case(
+        When(
+            GreaterThan(rating_count, 0),
+            then=RatingAverage(rating_sum, rating_count)
+        ),
+        default=Value(None),
+        output_field=DecimalField(max_digits=3, decimal_places=2)
+    )
+
+
+def is_rating_deferred() -> bool:
+    return settings.RATING_RECOMPUTE_MODE == 'deferred'
+
+
+def enqueue_rating(book_ids) -> None:
+    # Задачу ставим после коммита: иначе обработчик может удалить уже
+    # существующую задачу и пересчитать рейтинг, не увидев эту оценку
+    book_ids = list(book_ids)
+    transaction.on_commit(lambda: _insert_rating_tasks(book_ids))
+
+
+def _insert_rating_tasks(book_ids) -> None:
+    # Книга могла быть удалена в той же транзакции
+    existing = Book.objects.filter(pk__in=book_ids).values_list(
+        'pk', flat=True)
+
+    BookRatingTask.objects.bulk_create(
+        [BookRatingTask(book_id=book_id) for book_id in existing],
+        ignore_conflicts=True
+    )
 
 
 def set_rating(book):
+    if is_rating_deferred():
+        enqueue_rating([book.pk])
+        return
+
+    # Полный пересчет рейтинга одной книги
     data = UserBookRelation.objects.filter(
-        book=book).aggregate(rating=Avg('rate'))
-    rating = data.get('rating')
+        book=book,
+        rate__isnull=False
+    ).aggregate(rating_sum=Sum('rate'), rating_count=Count('rate'))
+
+    book.rating_sum = data.get('rating_sum') or 0
+    book.rating_count = data.get('rating_count')
+    book.rating = get_rating(book.rating_sum, book.rating_count)
+    # Пишем только колонки рейтинга, счетчики меняются через F()
+    book.save(update_fields=RATING_FIELDS)
+
+
+def _aggregate_relations(aggregate, **filters) -> Subquery:
+    relations = UserBookRelation.objects.filter(
+        book=OuterRef('pk'),
+        **filters
+    ).order_by().values('book').annotate(
+        value=aggregate
+    ).values('value')
+
+    return Subquery(relations)
+
+
+def _count_relations(**filters) -> Coalesce:
+    return Coalesce(_aggregate_relations(Count('pk'), **filters), Value(0))
+
+
+def get_counters_expressions() -> dict:
+    return {
+        'count_likes': _count_relations(like=True),
+        'count_bookmarks': _count_relations(is_bookmark=True),
+        'count_readers': _count_relations(),
+    }
+
+
+def get_rating_expressions() -> dict:
+    rating_sum = Coalesce(
+        _aggregate_relations(Sum('rate'), rate__isnull=False),
+        Value(0)
+    )
+    rating_count = _count_relations(rate__isnull=False)
+
+    return {
+        'rating_sum': rating_sum,
+        'rating_count': rating_count,
+        'rating': get_rating_expression(rating_sum, rating_count),
+    }
+
+
+def iterate_book_batches(books=None, batch_size: int = 1000):
+    # Keyset-проход по id, чтобы не держать всю таблицу в памяти
+    books = Book.objects.all() if books is None else books
+    last_pk = 0
+
+    while True:
+        batch = list(
+            books.filter(pk__gt=last_pk).order_by(
+                'pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            break
+
+        yield batch
+        last_pk = batch[-1]
+
+
+def rebuild_book_counters(books=None, batch_size: int = 1000) -> int:
+    updated = 0
+
+    for batch in iterate_book_batches(books, batch_size):
+        updated += Book.objects.filter(pk__in=batch).update(
+            updated_at=timezone.now(),
+            **get_counters_expressions()
+        )
+        # Счетчики не влияют на фильтры и сортировку списка
+        invalidate_books(batch, lists=False)
+
+    return updated
+
+
+def recompute_book_ratings(books=None, batch_size: int = 1000) -> int:
+    updated = 0
+
+    for batch in iterate_book_batches(books, batch_size):
+        updated += Book.objects.filter(pk__in=batch).update(
+            updated_at=timezone.now(),
+            **get_rating_expressions()
+        )
+        invalidate_books(batch)
+
+    return updated
+
+
+def reconcile_book_ratings(books=None, batch_size: int = 1000) -> int:
+    repaired = 0
+    expressions = get_rating_expressions()
+
+    for batch in iterate_book_batches(books, batch_size):
+        # Исправляем только книги, у которых сумма или количество разошлись
+        drifted = Book.objects.filter(pk__in=batch).annotate(
+            real_sum=expressions['rating_sum'],
+            real_count=expressions['rating_count'],
+        ).exclude(
+            rating_sum=F('real_sum'),
+            rating_count=F('real_count'),
+        ).values_list('pk', flat=True)
+
+        drifted = list(drifted)
+        if drifted:
+            repaired += Book.objects.filter(pk__in=drifted).update(
+                updated_at=timezone.now(),
+                **expressions
+            )
+            invalidate_books(drifted)
+
+    return repaired
+
+
+def refresh_book_stats(book_ids) -> int:
+    # Счетчики и рейтинг нескольких книг одним UPDATE
+    return Book.objects.filter(pk__in=book_ids).update(
+        updated_at=timezone.now(),
+        **get_counters_expressions(),
+        **get_rating_expressions()
+    )
+
+
+def apply_relations_bulk(user, items: dict) -> dict:
+    if not items:
+        return {}
+
+    existing = set(
+        UserBookRelation.objects.filter(
+            user=user,
+            book_id__in=items
+        ).values_list('book_id', flat=True)
+    )
+    statuses, groups = {}, {}
+
+    for book_id, data in items.items():
+        statuses[book_id] = 'updated' if book_id in existing else 'created'
+        # Как и в upsert, при конфликте пишем только переданные поля,
+        # иначе прочитанные значения затрут параллельные изменения
+        groups.setdefault(frozenset(data), []).append(
+            UserBookRelation(user=user, book_id=book_id, **data)
+        )
+
+    with transaction.atomic():
+        # Один INSERT ... ON CONFLICT на каждый набор полей, unique_fields -
+        # имена колонок, см. UserBookRelationManager.upsert
+        for fields, relations in groups.items():
+            conflict = {
+                'update_conflicts': True,
+                'unique_fields': ['user_id', 'book_id'],
+                'update_fields': sorted(fields),
+            } if fields else {'ignore_conflicts': True}
+
+            UserBookRelation.objects.bulk_create(relations, **conflict)
+
+        lists = any('rate' in data for data in items.values())
+        transaction.on_commit(lambda: invalidate_books(statuses, lists))
+
+    return statuses
+
+
+def drain_rating_queue(batch_size: int = 500) -> int:
+    processed = 0
+
+    while True:
+        with transaction.atomic():
+            book_ids = list(
+                BookRatingTask.objects.select_for_update(
+                    skip_locked=True
+                ).order_by('created_at').values_list(
+                    'book_id', flat=True
+                )[:batch_size]
+            )
+            if not book_ids:
+                break
+
+            # Изменения, пришедшие после удаления задач, попадут в очередь
+            # снова и будут учтены следующим проходом
+            BookRatingTask.objects.filter(book_id__in=book_ids).delete()
+            Book.objects.filter(pk__in=book_ids).update(
+                updated_at=timezone.now(),
+                **get_rating_expressions()
+            )
+            transaction.on_commit(
+                lambda book_ids=book_ids: invalidate_books(book_ids)
+            )
+
+        processed += len(book_ids)
 
-    if rating:
-        book.rating = rating
-        book.save()
\ No newline at end of file
+    return processed
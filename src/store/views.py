@@ -1,32 +1,175 @@
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError
 from django.db.models import Count, Case, When, Value, Avg
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.mixins import UpdateModelMixin
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 
 from .mixins.book import BookMixin
+from .mixins.cache import BookCacheMixin
+from .mixins.conditional import ConditionalGetMixin
+from .mixins.fast import BookFastListMixin
+from .export import EXPORT_FORMATS, export_books
+from .filters import BookFilter, BookOrderingFilter, BookSearchFilter
 from .models import Book, UserBookRelation
+from .pagination import BookCursorPagination, ReaderCursorPagination
 from .permissions import IsOwnerOrStaffOrReadOnly
-from .serializers import BookSerializer, UserBookRelationSerializer
+from .profiling import get_histograms, render_prometheus
+from .serializers import (
+    BookReadersSerializer, BookSerializer, UserBookRelationBulkSerializer,
+    UserBookRelationSerializer
+)
+from .utils import apply_relations_bulk
 
 
-class BookViewSet(ModelViewSet, BookMixin):
+class BookViewSet(ConditionalGetMixin, BookCacheMixin, BookFastListMixin,
+                  ModelViewSet, BookMixin):
     serializer_class = BookSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [
+        DjangoFilterBackend,
+        BookSearchFilter,
+        BookOrderingFilter
+    ]
     permission_classes = [IsOwnerOrStaffOrReadOnly]
-    filterset_fields = ['price']
+    pagination_class = BookCursorPagination
+    filterset_class = BookFilter
     search_fields = ['name', 'author']
-    ordering_fields = ['id', 'price']
+    ordering_fields = ['id', 'price', 'end_price']
+    ordering = ['id']
+    # Записи и проверке прав нужны только эти столбцы, из них же
+    # пересчитывается end_price. Сохраняются только загруженные поля
+    write_fields = {
+        'update': ('id', 'owner_id', 'price', 'discount', 'end_price',
+                   'updated_at'),
+        'partial_update': ('id', 'owner_id', 'price', 'discount',
+                           'end_price', 'updated_at'),
+        'destroy': ('id', 'owner_id'),
+    }
+
+    # Выбор полей ?fields= / ?omit= есть только у чтения
+    sparse_actions = ('list', 'retrieve')
 
     def get_queryset(self):
-        return self.get_books_queryset()
+        fields = self.write_fields.get(self.action)
+
+        if fields is not None:
+            return Book.objects.only(*fields)
+
+        return self.get_books_queryset(
+            self.request.user,
+            self.get_book_fields()
+        )
+
+    def get_book_fields(self) -> list | None:
+        params = self.request.query_params
+        if self.action not in self.sparse_actions or not (
+                'fields' in params or 'omit' in params):
+            return None
+
+        available = BookSerializer.Meta.fields
+        errors = {}
+        selection = {}
+
+        for param in ('fields', 'omit'):
+            names = [
+                name.strip() for name in params.get(param, '').split(',')
+                if name.strip()
+            ]
+            unknown = [name for name in names if name not in available]
+            if unknown:
+                errors[param] = [f'Unknown fields: {", ".join(unknown)}.']
+            selection[param] = names
+
+        if errors:
+            raise ValidationError(errors)
+
+        selected = selection['fields'] or available
+        return [
+            name for name in available
+            if name in selected and name not in selection['omit']
+        ]
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_book_fields()
+
+        return context
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        serializer = self.get_serializer(
+            instance,
+            data=request.data,
+            partial=partial
+        )
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+
+        # Аннотированная строка читается один раз, уже для ответа
+        book = self.get_books_queryset(request.user).get(pk=instance.pk)
+
+        return Response(self.get_serializer(book).data)
 
     def perform_create(self, serializer):
         serializer.validated_data['owner'] = self.request.user
         super().perform_create(serializer)
 
+    @action(detail=False)
+    def export(self, request):
+        export_format = request.query_params.get('export_format', 'ndjson')
+        compress = request.query_params.get('gzip') in ('1', 'true')
+
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({
+                'export_format': [
+                    f'Expected one of: {", ".join(EXPORT_FORMATS)}.'
+                ]
+            })
+
+        filename = f'books.{export_format}'
+        content_type = EXPORT_FORMATS[export_format]
+        if compress:
+            filename, content_type = f'{filename}.gz', 'application/gzip'
+
+        # Память не зависит от размера каталога: книги читаются пачками
+        response = StreamingHttpResponse(
+            export_books(
+                export_format,
+                compress=compress,
+                queryset=self.filter_queryset(self.get_queryset())
+            ),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{filename}"'
+        )
+
+        return response
+
+    @action(
+        detail=True,
+        filter_backends=[],
+        pagination_class=ReaderCursorPagination
+    )
+    def readers(self, request, pk=None):
+        book = get_object_or_404(Book.objects.only('pk'), pk=pk)
+        readers = get_user_model().objects.filter(
+            userbookrelation__book=book
+        ).only('id', 'username')
+
+        page = self.paginate_queryset(readers)
+        serializer = BookReadersSerializer(page, many=True)
+
+        return self.get_paginated_response(serializer.data)
+
 
 class UserBookRelationView(UpdateModelMixin, GenericViewSet):
     queryset = UserBookRelation.objects.all()
@@ -34,19 +177,97 @@ class UserBookRelationView(UpdateModelMixin, GenericViewSet):
     permission_classes = [IsAuthenticated]
     # Поле модели, которое будет использовано для поиска экземпляра UserBookRelation
     lookup_field = 'book_id'
+    # Максимальный размер пакета для /book-relations/bulk/
+    bulk_max_items = 500
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        serializer = self.get_serializer(data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+
+        # Книга берется из url, а не из тела запроса
+        values = dict(serializer.validated_data)
+        values.pop('book', None)
+
+        try:
+            relation, _ = UserBookRelation.objects.upsert(
+                request.user.id,
+                int(self.kwargs[self.lookup_field]),
+                **values
+            )
+        except (ValueError, IntegrityError, Book.DoesNotExist):
+            raise NotFound()
+
+        return Response(self.get_serializer(relation).data)
 
-    def get_object(self):
-        filter_kwargs = {
-            self.lookup_field: self.kwargs[self.lookup_field],
-            'user_id': self.request.user.id
-        }
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        items = request.data
 
-        obj, _ = UserBookRelation.objects.get_or_create(**filter_kwargs)
+        if not isinstance(items, list):
+            raise ValidationError({
+                'non_field_errors': ['Expected a list of items.']
+            })
+        if len(items) > self.bulk_max_items:
+            raise ValidationError({
+                'non_field_errors': [
+                    f'Ensure this list has no more than '
+                    f'{self.bulk_max_items} items.'
+                ]
+            })
 
-        self.check_object_permissions(self.request, obj)
+        results, valid = [], {}
+        for item in items:
+            serializer = UserBookRelationBulkSerializer(data=item)
 
-        return obj
+            if not serializer.is_valid():
+                results.append({
+                    'status': 'error',
+                    'errors': serializer.errors
+                })
+                continue
+
+            data = dict(serializer.validated_data)
+            book_id = data.pop('book')
+            # При повторе книги в пакете применяется последний элемент
+            valid[book_id] = data
+            results.append({'book': book_id})
+
+        found = set(
+            Book.objects.filter(pk__in=valid).values_list('pk', flat=True)
+        )
+        statuses = apply_relations_bulk(
+            request.user,
+            {book_id: data for book_id, data in valid.items()
+             if book_id in found}
+        )
+
+        for result in results:
+            book_id = result.get('book')
+
+            if book_id in statuses:
+                result['status'] = statuses[book_id]
+            elif book_id is not None:
+                result['status'] = 'error'
+                result['errors'] = {
+                    'book': [
+                        f'Invalid pk "{book_id}" - object does not exist.'
+                    ]
+                }
+
+        return Response({'results': results})
 
 
 def auth_github(request):
     return render(request, 'oauth.html')
+
+
+def metrics(request):
+    # Гистограммы профилирования в текстовом формате Prometheus
+    if not settings.PROFILING_ENABLED:
+        raise Http404
+
+    return HttpResponse(
+        render_prometheus(get_histograms()),
+        content_type='text/plain; version=0.0.4'
+    )